@@ -0,0 +1,32 @@
+# Decoding time of BINP replies versus reply size.
+#   python benchmarks/bench_binp_decode.py
+import time
+import numpy as np
+from pihexapod.pigcs_epics import decode_binp
+
+def decode_per_byte(val):
+    # what get_binary used to do
+    v = ""
+    for b in val:
+        v = v+chr(b)
+    return v
+
+def timeit(func, val, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func(val)
+    return (time.perf_counter() - t0)/repeat
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'bytes':>8s} {'per byte (us)':>14s} {'decode_binp (us)':>17s}")
+    for size in (64, 512, 4096, 16384, 65536):
+        val = rng.integers(32, 127, size, dtype=np.uint8)
+        assert decode_binp(val) == decode_per_byte(val)
+        repeat = max(10, 200000//size)
+        t_old = timeit(decode_per_byte, val, max(3, repeat//10))
+        t_new = timeit(decode_binp, val, repeat)
+        print(f"{size:8d} {t_old*1e6:14.1f} {t_new*1e6:17.2f}")
+
+if __name__ == '__main__':
+    main()
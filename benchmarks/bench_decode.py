@@ -0,0 +1,79 @@
+# Parsing time of KLT? and of the per-axis replies versus the number of coordinate systems.
+#   python benchmarks/bench_decode.py
+import time
+from pihexapod.simulator import SimulatedController, AXES
+from pihexapod import decode
+
+def decode_KLT_split(s):
+    # what decode_KLT used to do
+    m = s.split('\n')
+    cslist = []
+    for l in m:
+        mydic = {}
+        fd = l.split('\t')
+        for f in fd:
+            kv = f.split('=')
+            if len(kv)==2:
+                val = decode.str2num(kv[1])
+                if val==None:
+                    mydic[kv[0]]=kv[1].strip()
+                else:
+                    mydic[kv[0]]=val
+        cslist.append(mydic)
+    return cslist
+
+def decode_ONT_split(s):
+    # what decode_ONT used to do
+    mydic = {}
+    for l in s.split('\n'):
+        kv = l.split('=')
+        if len(kv)==2:
+            valstr = kv[1].strip()
+            if valstr=='1':
+                val = True
+            elif valstr =='0':
+                val = False
+            else:
+                val = valstr
+            mydic[kv[0]]=val
+    return mydic
+
+def timeit(func, val, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func(val)
+    return (time.perf_counter() - t0)/repeat
+
+def main():
+    c = SimulatedController()
+    defined = 1
+    print(f"{'CSs':>5s} {'bytes':>7s} {'split (us)':>11s} {'decode_KLT (us)':>16s}")
+    for n in (1, 10, 50, 100, 200, 500):
+        while defined < n:
+            c.execute(f"KSD CS{defined:04d} " + ' '.join(f"{ax} {0.001*defined:.3f}" for ax in AXES))
+            defined += 1
+        s = c.execute('KLT?')
+        old = [cs for cs in decode_KLT_split(s) if len(cs)>0]
+        new = decode.decode_KLT(s)
+        assert [cs['Name'] for cs in old] == [cs['Name'] for cs in new]
+        repeat = max(20, 20000//n)
+        t_old = timeit(decode_KLT_split, s, repeat)
+        t_new = timeit(decode.decode_KLT, s, repeat)
+        print(f"{n:5d} {len(s):7d} {t_old*1e6:11.1f} {t_new*1e6:16.1f}")
+    print()
+    repeat = 20000
+    for cmd, func, old in (('ONT?', decode.decode_ONT, decode_ONT_split),
+                           ('POS?', decode.decode_POS, None),
+                           ('SVO?', decode.decode_SVO, None),
+                           ('FRF?', decode.decode_FRF, None),
+                           ('WAV?', decode.decode_WAV, None)):
+        s = c.execute(cmd)
+        t_new = timeit(func, s, repeat)
+        line = f"{cmd:5s} {func.__name__:<12s} {t_new*1e6:8.2f} us"
+        if old is not None:
+            assert old(s) == func(s)
+            line = line + f"   split {timeit(old, s, repeat)*1e6:8.2f} us"
+        print(line)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# Parsing time of DRR? replies (12 record tables) versus the number of samples.
+#   python benchmarks/bench_drr_decode.py
+import time
+import numpy as np
+from pihexapod.decode import decode_DRR
+
+def decode_DRR_lists(s):
+    # what get_records used to do: 12 lists appended line by line
+    cols = [[] for _ in range(12)]
+    data = {}
+    for l in s.split('\n'):
+        if len(l)==0:
+            continue
+        if l[0] == '#':
+            if 'SAMPLE_TIME' in l:
+                data['Sample Time'] = float(l.split(' = ')[1])
+        else:
+            n = l.split(' ')
+            for i in range(12):
+                cols[i].append(float(n[i]))
+    for i, ax in enumerate(['X', 'Y', 'Z', 'U', 'V', 'W']):
+        data[ax] = (np.array(cols[2*i]), np.array(cols[2*i+1]))
+    return data
+
+def make_reply(nsamples, rng):
+    header = ["# TYPE = 1 ", "# SEPARATOR = 32 ", "# DIM = 12 ", "# SAMPLE_TIME = 0.001000 ",
+              f"# NDATA = {nsamples} "]
+    header += [f"# NAME{i} = 0 0 " for i in range(12)]
+    header += ["# END_HEADER "]
+    values = rng.uniform(-5, 5, (nsamples, 12))
+    rows = [' '.join(f"{v:.6f}" for v in row) + ' ' for row in values]
+    return '\n'.join(header + rows)[:-1] + '\n'
+
+def timeit(func, val, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func(val)
+    return (time.perf_counter() - t0)/repeat
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'samples':>8s} {'MB':>6s} {'lists (ms)':>11s} {'decode_DRR (ms)':>16s}")
+    for n in (1000, 10000, 100000, 1000000):
+        s = make_reply(n, rng)
+        new = decode_DRR(s)
+        if n <= 100000:
+            old = decode_DRR_lists(s)
+            assert all(np.array_equal(old[ax][k], new[ax][k]) for ax in 'XYZUVW' for k in (0, 1))
+            t_old = f"{timeit(decode_DRR_lists, s, 3)*1e3:11.1f}"
+        else:
+            t_old = f"{'-':>11s}"
+        t_new = timeit(decode_DRR, s, 3)
+        print(f"{n:8d} {len(s)/1e6:6.1f} {t_old} {t_new*1e3:16.1f}")
+
+if __name__ == '__main__':
+    main()
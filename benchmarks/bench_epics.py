@@ -0,0 +1,39 @@
+# Latency of the EPICS transport (pigcs_epics) against the simulated asyn record,
+# for growing KLT? replies.
+#   python benchmarks/bench_epics.py --latency 0.002
+import argparse
+import os
+import time
+os.environ.setdefault('EPICS_CA_ADDR_LIST', '127.0.0.1')
+os.environ.setdefault('EPICS_CA_AUTO_ADDR_LIST', 'NO')
+from pihexapod.ioc import IOC
+from pihexapod.pigcs_epics import Hexapod
+
+def timeit(label, func, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        v = func()
+    dt = (time.perf_counter() - t0)/repeat
+    print(f"{label:<36s} {dt*1e3:10.3f} ms")
+    return v
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds between AOUT put and reply")
+    parser.add_argument('--imax', type=int, default=65536)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    with IOC('SIMHXP', latency=args.latency, imax=args.imax) as ioc:
+        h = Hexapod('SIMHXP')
+        timeit("connect", h.connect, 1)
+        ncs = 0
+        for n in (0, 10, 50, 200):
+            while ncs < n:
+                ioc.controller.execute(f"KSD CS{ncs:04d} X {0.001*ncs:.3f} Z 1")
+                ncs += 1
+            timeit(f"get_pos ({n} CS)", h.get_pos, args.repeat)
+            s = timeit(f"qKLT ({n} CS)", h.qKLT, args.repeat)
+            print(f"{'':<36s} {len(s):10d} bytes")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+# Drawing time of plot_record for long recordings, all points versus min/max decimation.
+#   MPLBACKEND=Agg python benchmarks/bench_plot.py
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from pihexapod.record import Record
+from pihexapod.plot import RecordPlot
+
+def make_record(nsamples, rng):
+    target = np.linspace(-2.5, 2.5, nsamples)
+    real = target + rng.normal(0, 20e-6, nsamples)
+    data = np.zeros((nsamples, 12))
+    data[:, 0] = target
+    data[:, 1] = real
+    return Record(data, sample_time=0.001)
+
+def draw_time(rec, width):
+    t0 = time.perf_counter()
+    p = RecordPlot('X', width)
+    p.plot(rec)
+    p.fig.canvas.draw()
+    dt = time.perf_counter() - t0
+    plt.close(p.fig)
+    return dt
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'samples':>8s} {'all (ms)':>9s} {'decimated (ms)':>15s}")
+    for n in (10000, 100000, 1000000):
+        rec = make_record(n, rng)
+        t_all = draw_time(rec, n)
+        t_dec = draw_time(rec, 2000)
+        print(f"{n:8d} {t_all*1e3:9.1f} {t_dec*1e3:15.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+# Round trips and throughput of pihexapod.gcs.Hexapod against the simulated C-887.
+#   python benchmarks/bench_roundtrip.py --latency 0.0005
+import argparse
+import itertools
+import time
+from pihexapod.simulator import Simulator
+from pihexapod.gcs import Hexapod
+
+def timeit(label, func, repeat, sim, h):
+    # commands: lines the controller executed, sent: GCS commands before merging
+    c0, q0 = sim.controller.commands, sim.controller.queries
+    s0 = h.command_count[0]
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    dt = (time.perf_counter() - t0)/repeat
+    commands = (sim.controller.commands - c0)/repeat
+    queries = (sim.controller.queries - q0)/repeat
+    sent = (h.command_count[0] - s0)/repeat
+    print(f"{label:<28s} {dt*1e3:10.3f} ms {commands:8.1f} commands ({sent:.1f} sent) {queries:8.1f} queries")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+    with Simulator(port=0, latency=args.latency, time_scale=100) as sim:
+        h = Hexapod(sim.address)
+        timeit("get_pos", h.get_pos, args.repeat, sim, h)
+        timeit("isattarget", h.isattarget, args.repeat, sim, h)
+        timeit("get_CS", h.get_CS, args.repeat, sim, h)
+        timeit("get_allcs", h.get_allcs, args.repeat, sim, h)
+        n = itertools.count()
+        timeit("add_CS", lambda: h.add_CS(csname=f"B{next(n)}", X=1, Y=2), 10, sim, h)
+        timeit("get_mycsinfo", h.get_mycsinfo, args.repeat, sim, h)
+        timeit("refresh_CS", h.refresh_CS, args.repeat, sim, h)
+        h.set_default_CS()
+        timeit("reset_record_table", h.reset_record_table, 10, sim, h)
+        timeit("set_traj", lambda: h.set_traj(totaltime=1, totaltravel=1), 3, sim, h)
+        timeit("set_traj_SNAKE 20 lines", lambda: h.set_traj_SNAKE(time_per_line=1, Yf=2, Y_step=0.1), 3, sim, h)
+        h.disconnect()
+
+if __name__ == '__main__':
+    main()
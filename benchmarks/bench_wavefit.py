@@ -0,0 +1,46 @@
+# Upload size and time of sampled paths as WAV PNT points versus fitted LIN/RAMP segments.
+#   python benchmarks/bench_wavefit.py --latency 0.0005
+import argparse
+import time
+import numpy as np
+from pihexapod.simulator import Simulator
+from pihexapod.gcs import Hexapod
+from pihexapod.commands import wav_points
+from pihexapod.wavefit import fit_commands
+
+def paths(n, rng):
+    t = np.arange(n)
+    yield 'piecewise linear', np.interp(t, np.linspace(0, n-1, 40), rng.uniform(-2, 2, 40))
+    c = 400
+    tri = np.where(t % 1000 < c, (t % 1000)/c, 1 - (t % 1000 - c)/(1000 - c))
+    yield 'triangle', tri
+    yield 'sine', 0.5*np.sin(np.linspace(0, 8*np.pi, n))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--points', type=int, default=100000)
+    parser.add_argument('--tol', type=float, default=1e-5)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    with Simulator(port=0, latency=args.latency) as sim:
+        h = Hexapod(sim.address)
+        print(f"{'path':<18s} {'PNT kB':>8s} {'fit kB':>8s} {'segments':>9s} {'PNT (s)':>8s} {'fit (s)':>8s} {'max err (nm)':>13s}")
+        for name, y in paths(args.points, rng):
+            pnt = sum(map(len, wav_points(1, y)))
+            segs = fit_commands(1, y, args.tol)
+            fit = sum(map(len, segs))
+            h.wavecache.invalidate()
+            t0 = time.perf_counter()
+            h.set_wav_points('X', y)
+            t_pnt = time.perf_counter() - t0
+            h.wavecache.invalidate()
+            t0 = time.perf_counter()
+            tid = h.set_wav_points('X', y, tol=args.tol)
+            t_fit = time.perf_counter() - t0
+            err = np.abs(sim.controller.wave_tables[tid] - y).max()
+            print(f"{name:<18s} {pnt/1e3:8.1f} {fit/1e3:8.1f} {len(segs):9d} {t_pnt:8.3f} {t_fit:8.3f} {err*1e6:13.1f}")
+        h.disconnect()
+
+if __name__ == '__main__':
+    main()
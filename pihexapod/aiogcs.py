@@ -0,0 +1,295 @@
+# asyncio GCS client for a direct TCP connection to the C-887 (port 50000).
+# Queries are written as soon as they are made and their answers are matched
+# in order, so several coroutines can have queries in flight on one socket.
+#
+#   h = Hexapod('10.54.122.145')
+#   await h.connect()
+#   pos, data = await asyncio.gather(h.get_pos(), h.get_records())
+#
+# ThreadedHexapod runs the client on a loop in a background thread and offers
+# the blocking interface of pigcs.Hexapod, which is what gcs.Hexapod uses with
+# Hexapod(IP, use_asyncio=True).
+import asyncio
+import socket
+import threading
+from collections import deque
+from pipython import gcserror
+from .decode import decode_ONT, decode_DRC, decode_axes, decode_POS, decode_SVO, decode_FRF, decode_WAV, RECORD_CHANNELS
+from .commands import CommandPipeline
+from .record import Record
+
+class Hexapod:
+    """asyncio GCS client"""
+    def __init__(self, IP, port=50000, timeout=7) -> None:
+        self.connectiontype = -1
+        self.axes = ['X', 'Y', 'Z', 'U', 'V', 'W']
+        self.ip = IP
+        self.port = port
+        self.timeout = timeout
+        self.errcheck = True
+        self.reader = None
+        self.writer = None
+        self._receiver = None
+        self._pending = deque()
+
+    async def connect(self, IP=""):
+        """connecting
+        IP can carry a port, e.g. '127.0.0.1:50001' for the simulator."""
+        if len(IP)>0:
+            self.ip = IP
+        host, _, port = self.ip.partition(':')
+        if len(port)>0:
+            self.port = int(port)
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(host, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            print('Connection failed. Check your IP or another software running for the IP.')
+            return self.connectiontype
+        self.writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._receiver = asyncio.ensure_future(self._receive())
+        self.connectiontype = 2
+        return self.connectiontype
+
+    async def close(self):
+        """disconnect"""
+        if self.writer is None:
+            return
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+        if self._receiver is not None:
+            await self._receiver
+        self.writer = None
+        self.connectiontype = -1
+
+    async def _receive(self):
+        """hand each complete answer to the oldest waiting query"""
+        answer = b''
+        try:
+            while True:
+                line = await self.reader.readline()
+                if len(line)==0:
+                    break
+                answer = answer + line
+                # ' \n' marks a continued, multi-line answer.
+                if line.endswith(b' \n'):
+                    continue
+                if len(self._pending)>0:
+                    fut = self._pending.popleft()
+                    if not fut.done():
+                        fut.set_result(answer.decode('cp1252'))
+                answer = b''
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            while len(self._pending)>0:
+                fut = self._pending.popleft()
+                if not fut.done():
+                    fut.set_exception(gcserror.GCSError(gcserror.E_2_SEND_ERROR, 'connection closed'))
+
+    def _ask(self, cmd):
+        """write a query, return the future of its answer"""
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append(fut)
+        self.writer.write(f"{cmd}\n".encode('cp1252'))
+        return fut
+
+    async def _answer(self, fut):
+        try:
+            return await asyncio.wait_for(fut, self.timeout)
+        except asyncio.TimeoutError:
+            raise gcserror.GCSError(gcserror.E_7_COM_TIMEOUT, '@ aiogcs') from None
+
+    async def _checkerror(self, fut):
+        err = int(await self._answer(fut))
+        if err:
+            raise gcserror.GCSError(err)
+
+    async def send_command(self, cmd):
+        self.writer.write(f"{cmd}\n".encode('cp1252'))
+        if self.errcheck:
+            err = self._ask('ERR?')
+            await self.writer.drain()
+            await self._checkerror(err)
+        else:
+            await self.writer.drain()
+
+    async def send_commands(self, cmds):
+        """write all cmds back-to-back, each followed by ERR?, then read the errors.
+        The first failing command is named in the GCSError."""
+        errs = []
+        for cmd in cmds:
+            self.writer.write(f"{cmd}\n".encode('cp1252'))
+            if self.errcheck:
+                errs.append(self._ask('ERR?'))
+        await self.writer.drain()
+        failed = None
+        for cmd, fut in zip(cmds, errs):
+            err = int(await self._answer(fut))
+            if err and failed is None:
+                failed = gcserror.GCSError(err, f"at {cmd!r}")
+        if failed is not None:
+            raise failed
+
+    async def send_read_command(self, cmd):
+        fut = self._ask(cmd)
+        err = self._ask('ERR?') if self.errcheck else None
+        await self.writer.drain()
+        answer = await self._answer(fut)
+        if err is not None:
+            await self._checkerror(err)
+        return answer
+
+    async def send_read_commands(self, cmds):
+        """write the queries cmds back-to-back, then one ERR?; returns their answers in order"""
+        futs = [self._ask(cmd) for cmd in cmds]
+        err = self._ask('ERR?') if self.errcheck else None
+        await self.writer.drain()
+        answers = [await self._answer(fut) for fut in futs]
+        if err is not None:
+            await self._checkerror(err)
+        return answers
+
+    async def qERR(self):
+        fut = self._ask('ERR?')
+        await self.writer.drain()
+        return int(await self._answer(fut))
+
+    async def KEN(self, CS):
+        """KEN"""
+        await self.send_command(f"KEN {CS}")
+
+    async def KRM(self, csname):
+        await self.send_command(f"KRM {csname}")
+
+    async def KLN(self, cs, parent):
+        await self.send_command(f"KLN {cs} {parent}")
+
+    async def KSD(self, **kwargs):
+        axstr = ""
+        for key, value in kwargs.items():
+            if key in self.axes:
+                axstr = axstr+f" {key} "+ str(value)
+            if key == "csname":
+                CS = value.upper()
+        await self.send_command(f"KSD {CS} {axstr}")
+
+    async def FRF(self):
+        await self.send_command("FRF X")
+
+    async def SVO(self):
+        await self.send_command("SVO X 1")
+
+    async def qFRF(self):
+        return decode_FRF(await self.send_read_command('FRF?'))
+
+    async def qSVO(self):
+        return decode_SVO(await self.send_read_command('SVO?'))
+
+    async def qKET(self):
+        """KET?"""
+        return decode_axes(await self.send_read_command('KET?'), str)
+
+    async def qKLT(self):
+        """KLT?"""
+        return await self.send_read_command('KLT?')
+
+    async def get_pos(self):
+        return decode_POS(await self.send_read_command('POS?'))
+
+    async def isattarget(self, axis=""):
+        v = decode_ONT(await self.send_read_command('ONT?'))
+        if len(axis):
+            return v[axis]
+        return all(v[ax] for ax in self.axes)
+
+    async def mv(self, *argv, wait=False):
+        # mv('X', 1.0, 'Y', 2.0)
+        cmd = 'MOV'
+        for arg in argv:
+            cmd = cmd + ' %s' % arg
+        await self.send_command(cmd)
+        if wait:
+            await self.wait()
+        return True
+
+    async def wait(self, interval=0.01):
+        while not await self.isattarget():
+            await asyncio.sleep(interval)
+
+    async def get_wavelen(self, wavetableID=-1):
+        wav = decode_WAV(await self.send_read_command('WAV?'))
+        if wavetableID >= 0:
+            return wav[wavetableID][1]
+        return wav
+
+    async def get_records(self, Ndata=0):
+        """Record of the tables the recorder is configured for (DRC?), as gcs.Hexapod.get_records.
+        Ndata: 0 for the length of the wave table selected for the first recorded axis."""
+        drc, rtr, wsl, wav = await asyncio.gather(
+            self.send_read_command('DRC?'), self.send_read_command('RTR?'),
+            self.send_read_command('WSL?'), self.send_read_command('WAV?'))
+        # nothing configured yet: the tables of reset_record_table, as gcs assumes
+        channels = decode_DRC(drc) or list(RECORD_CHANNELS)
+        if Ndata == 0:
+            selection = decode_axes(wsl, int)
+            # the SNAKE X table when no recorded axis has one selected
+            table = 13
+            for ax, _ in channels:
+                gen = str(self.axes.index(ax)+1) if ax in self.axes else None
+                if selection.get(gen, 0) > 0:
+                    table = selection[gen]
+                    break
+            Ndata = -(-decode_WAV(wav)[table][1]//int(rtr))
+        tables = ' '.join(str(i+1) for i in range(len(channels)))
+        dt = await self.send_read_command(f"DRR? 1 {Ndata} {tables}")
+        return Record.from_DRR(dt, channels)
+
+class ThreadedHexapod(CommandPipeline):
+    """An aiogcs.Hexapod on an event loop of its own thread, with blocking methods.
+    The async client is .aio and its loop is .loop, e.g.
+        asyncio.run_coroutine_threadsafe(h.aio.get_pos(), h.loop)"""
+    def __init__(self, IP, port=50000, timeout=7) -> None:
+        self.aio = Hexapod(IP, port, timeout)
+        self.loop = None
+        self.thread = None
+        self._init_pipeline()
+
+    def run(self, coro):
+        """run coro on the client loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def connect(self, IP=""):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+            self.thread.start()
+        return self.run(self.aio.connect(IP))
+
+    def close(self):
+        """disconnect"""
+        if self.loop is None:
+            return
+        self.run(self.aio.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+
+    def _write_command(self, cmd):
+        self.run(self.aio.send_command(cmd))
+
+    def _write_lines(self, lines):
+        self.run(self.aio.send_commands(lines))
+
+    def __getattr__(self, name):
+        attr = getattr(self.aio, name)
+        if asyncio.iscoroutinefunction(attr):
+            def call(*args, **kwargs):
+                self.flush()
+                return self.run(attr(*args, **kwargs))
+            return call
+        return attr
@@ -0,0 +1,106 @@
+# On-disk archive of recorder runs.
+# Each run is one .npy file with the (samples, tables) array of its Record, so
+# it can be opened as a memory map without reading it; the triggers, if any,
+# go to a second .npy file. index.jsonl has one line per run with the sample
+# time, the record channels, the active CS and the scan parameters, and is
+# only ever appended to.
+#
+#   ar = RecordArchive('scans')
+#   h.save_records(ar, sample='Au')     # or ar.append(record, meta)
+#   rec = ar.open(-1)                   # Record over a memory map
+#   [run['run'] for run in ar.find(cs='PTYCHO')]
+import json
+import os
+import threading
+import time
+import numpy as np
+from .record import Record
+
+INDEX_FILE = 'index.jsonl'
+# keys of an index entry set by append(); meta may not use them
+RESERVED_KEYS = ('run', 'name', 'time', 'samples', 'sample_time', 'channels', 'triggers')
+
+def _json_default(obj):
+    # numpy values in the scan parameters
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"{type(obj).__name__} can not be saved in the archive index.")
+
+class RecordArchive:
+    """path: directory of the archive, created if needed."""
+    def __init__(self, path) -> None:
+        self.path = path
+        os.makedirs(os.path.join(path, 'runs'), exist_ok=True)
+        self.lock = threading.Lock()
+        self.index = []
+        self._load_index()
+
+    def _load_index(self):
+        fn = os.path.join(self.path, INDEX_FILE)
+        if not os.path.exists(fn):
+            return
+        with open(fn) as f:
+            for l in f:
+                if l.strip():
+                    self.index.append(json.loads(l))
+
+    def _file(self, run, kind='data'):
+        return os.path.join(self.path, 'runs', f"{run:06d}_{kind}.npy")
+
+    def append(self, record, meta=None, triggers=None, name=''):
+        """save record (a Record, or the blocks of iter_records) as a new run.
+        meta: {..} of scan parameters, e.g. the active CS under 'cs'.
+        Its keys may not be RESERVED_KEYS (ValueError).
+        triggers: indices of the trigger pulses in the wave table.
+        returns the run number."""
+        reserved = [k for k in (meta or {}) if k in RESERVED_KEYS]
+        if reserved:
+            raise ValueError(f"{', '.join(reserved)} can not be given in meta, the archive sets them.")
+        if not isinstance(record, Record):
+            blocks = list(record)
+            if len(blocks) == 0:
+                raise ValueError("No records to append.")
+            record = Record(np.concatenate([b.data for b in blocks]),
+                            blocks[0].channels, blocks[0].sample_time)
+        with self.lock:
+            run = len(self.index)
+            np.save(self._file(run), np.ascontiguousarray(record.data))
+            if triggers is not None:
+                np.save(self._file(run, 'triggers'), np.asarray(triggers))
+            entry = {'run': run, 'name': name, 'time': time.time(),
+                     'samples': record.samples, 'sample_time': record.sample_time,
+                     'channels': [list(ch) for ch in record.channels],
+                     'triggers': triggers is not None}
+            entry.update(meta or {})
+            line = json.dumps(entry, default=_json_default)
+            # the data is on disk before the run is in the index
+            with open(os.path.join(self.path, INDEX_FILE), 'a') as f:
+                f.write(line + '\n')
+            self.index.append(json.loads(line))
+        return run
+
+    def __len__(self):
+        return len(self.index)
+
+    def meta(self, run):
+        return self.index[run]
+
+    def open(self, run, mmap=True):
+        """Record of the run; with mmap, its data stays on disk until used."""
+        entry = self.index[run]
+        data = np.load(self._file(entry['run']), mmap_mode='r' if mmap else None)
+        return Record(data, [tuple(ch) for ch in entry['channels']], entry['sample_time'])
+
+    def triggers(self, run, mmap=True):
+        """trigger indices of the run, None if none were saved"""
+        entry = self.index[run]
+        if not entry['triggers']:
+            return None
+        return np.load(self._file(entry['run'], 'triggers'), mmap_mode='r' if mmap else None)
+
+    def find(self, **match):
+        """index entries whose values equal all of match, e.g. find(cs='PTYCHO')"""
+        return [entry for entry in self.index
+                if all(entry.get(k) == v for k, v in match.items())]
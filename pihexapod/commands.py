@@ -0,0 +1,156 @@
+# Merging of GCS commands.
+# Many GCS commands take several (id, argument) items per line, e.g.
+#   DRC 1 X 1 2 X 2 ...   WSL 1 13 3 14   TWS 1 50 2 1 51 3 ...
+# coalesce() joins consecutive commands of such verbs into as few lines as the
+# controller accepts. CommandPipeline holds commands back and writes them
+# coalesced, for the transports.
+import threading
+from contextlib import contextmanager
+
+MAX_LINE_LENGTH = 1000  # characters per command line; allocate_pulses used 50 TWS items (~1000)
+
+# verb: (number of arguments per item, how many of them identify the item)
+# an identifier may appear only once per line.
+MULTI_ITEM_VERBS = {
+    'DRC': (3, 1),
+    'WSL': (2, 1),
+    'WGC': (2, 1),
+    'CTO': (3, 2),
+    'TWS': (3, 2),
+}
+
+def coalesce(cmds, max_length=MAX_LINE_LENGTH):
+    """merge consecutive commands of MULTI_ITEM_VERBS, return the lines to write"""
+    lines = []
+    verb = None     # verb of the line being built
+    line = ''
+    keys = set()
+    for cmd in cmds:
+        fields = cmd.split()
+        v = fields[0].upper() if len(fields) > 0 else ''
+        if v not in MULTI_ITEM_VERBS or (len(fields) - 1) % MULTI_ITEM_VERBS[v][0] != 0:
+            if verb is not None:
+                lines.append(line)
+                verb = None
+            lines.append(cmd)
+            continue
+        if v != verb and verb is not None:
+            lines.append(line)
+            verb = None
+        size, nkey = MULTI_ITEM_VERBS[v]
+        for i in range(1, len(fields), size):
+            item = ' '.join(fields[i:i+size])
+            key = tuple(fields[i:i+nkey])
+            if verb is not None and (key in keys or len(line) + 1 + len(item) > max_length):
+                lines.append(line)
+                verb = None
+            if verb is None:
+                verb = v
+                line = v
+                keys = set()
+            line = f"{line} {item}"
+            keys.add(key)
+    if verb is not None:
+        lines.append(line)
+    return lines
+
+def wav_points(table, values, max_length=MAX_LINE_LENGTH):
+    """'WAV table X|& PNT 1 n v1 .. vn' commands loading values (in mm) into the wave table,
+    each at most max_length characters. The first one clears the table."""
+    texts = [f"{v:.6f}" for v in values]
+    cmds = []
+    start = 0
+    while start < len(texts):
+        prefix = f"WAV {table} {'&' if start else 'X'} PNT 1 {len(texts)-start}"
+        room = max_length - len(prefix)
+        end = start
+        while end < len(texts) and room > len(texts[end]):
+            room -= len(texts[end]) + 1
+            end += 1
+        if end == start:
+            raise ValueError(f"max_length {max_length} is too short for a WAV PNT command.")
+        cmds.append(f"WAV {table} {'&' if start else 'X'} PNT 1 {end-start} {' '.join(texts[start:end])}")
+        start = end
+    return cmds
+
+class CommandPipeline:
+    """pipeline(), send_command() and flush() of a transport, shared by pigcs.Hexapod
+    and aiogcs.ThreadedHexapod. The transport provides
+        _write_command(cmd): write one command and check its error,
+        _write_lines(lines): write the lines back-to-back and raise a GCSError naming the
+            first failing one.
+    Commands sent by the thread that opened the pipeline are held back until it ends,
+    or until that thread, or another one, queries. An error of the held back commands is
+    always raised in the thread that sent them, when its pipeline ends at the latest."""
+    def _init_pipeline(self):
+        # commands held back by pipeline()
+        self._batch = []
+        self._batchdepth = 0
+        self._batchthread = None
+        self._batcherror = None     # error of the batch, flushed by another thread
+        self._batchlock = threading.RLock()
+        # GCS commands asked for and command lines actually written
+        self.commands_sent = 0
+        self.lines_written = 0
+
+    def _owns_pipeline(self):
+        return self._batchdepth>0 and self._batchthread == threading.get_ident()
+
+    def send_command(self, cmd):
+        with self._batchlock:
+            if self._owns_pipeline():
+                self._batch.append(cmd)
+                return
+            self.flush()
+            self.commands_sent += 1
+            self.lines_written += 1
+            self._write_command(cmd)
+
+    @contextmanager
+    def pipeline(self):
+        """commands sent in the block are written back-to-back when it ends (or before the next query),
+        and their errors are checked together.
+        Consecutive DRC, WSL, WGC, CTO or TWS commands are merged into one line (see commands.coalesce).
+        While another thread has a pipeline open, the block sends its commands one by one."""
+        with self._batchlock:
+            foreign = self._batchdepth>0 and self._batchthread != threading.get_ident()
+            if not foreign:
+                self._batchthread = threading.get_ident()
+                self._batchdepth += 1
+        if foreign:
+            yield
+            return
+        try:
+            yield
+        finally:
+            with self._batchlock:
+                self._batchdepth -= 1
+                if self._batchdepth == 0:
+                    try:
+                        self.flush()
+                    finally:
+                        self._batchthread = None
+
+    def flush(self):
+        """write the commands held back by pipeline()"""
+        with self._batchlock:
+            owner = self._batchthread is None or self._batchthread == threading.get_ident()
+            if owner and self._batcherror is not None:
+                err, self._batcherror = self._batcherror, None
+                self._batch = []
+                raise err
+            if len(self._batch)==0:
+                return
+            cmds = self._batch
+            self._batch = []
+            lines = coalesce(cmds)
+            self.commands_sent += len(cmds)
+            self.lines_written += len(lines)
+            try:
+                self._write_lines(lines)
+            except Exception as e:
+                if owner:
+                    raise
+                # the query of another thread wrote them; the sender gets the error.
+                if self._batcherror is None:
+                    self._batcherror = e
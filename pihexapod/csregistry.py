@@ -0,0 +1,79 @@
+# Coordinate systems of the controller, cached on the host.
+# gcs.Hexapod reads KLT? and KET? once, then applies the KSD, KLN, KEN and KRM
+# it sends to the cached copy instead of asking the controller again.
+# The cache is dropped by invalidate() after a failed command and re-read on
+# the next use, or explicitly with Hexapod.refresh_CS().
+from collections import OrderedDict
+from .decode import decode_KLT, decode_KET
+
+class CSRegistry:
+    """KLT? and KET? state.
+    systems: OrderedDict name -> dict as decode_KLT returns it, None until loaded.
+    active: the enabled KSD coordinate system, None for ZERO (as decode_KET)."""
+    def __init__(self, axes=('X', 'Y', 'Z', 'U', 'V', 'W')) -> None:
+        self.axes = list(axes)
+        self.systems = None
+        self.active = None
+        self.active_loaded = False
+
+    def invalidate(self):
+        self.systems = None
+        self.active = None
+        self.active_loaded = False
+
+    @property
+    def loaded(self):
+        return self.systems is not None and self.active_loaded
+
+    def load_KLT(self, s):
+        """fill from a KLT? reply"""
+        self.systems = OrderedDict()
+        for cs in decode_KLT(s):
+            if 'Name' in cs:
+                self.systems[cs['Name']] = cs
+
+    def load_KET(self, s):
+        """fill from a KET? reply"""
+        self.active = decode_KET(s)
+        self.active_loaded = True
+
+    def allcs(self):
+        """copies of the KLT? entries, so callers may change them"""
+        return [dict(cs) for cs in self.systems.values()]
+
+    def get(self, name):
+        cs = self.systems.get(name)
+        if cs is None:
+            return None
+        return dict(cs)
+
+    # the commands, applied as the controller applies them
+    def KSD(self, name, **values):
+        name = name.upper()
+        if self.systems is None:
+            return
+        if name not in self.systems:
+            cs = OrderedDict([('Name', name), ('EndCoordinateSystem', 'ZERO')])
+            for ax in self.axes:
+                cs[ax] = 0.0
+            self.systems[name] = cs
+        for key, value in values.items():
+            if key in self.axes:
+                self.systems[name][key] = float(value)
+
+    def KLN(self, child, parent):
+        if self.systems is None:
+            return
+        child = child.upper()
+        if child in self.systems:
+            self.systems[child]['EndCoordinateSystem'] = parent.upper()
+
+    def KEN(self, name):
+        name = name.upper()
+        self.active = None if name == 'ZERO' else name
+        self.active_loaded = True
+
+    def KRM(self, name):
+        if self.systems is None:
+            return
+        self.systems.pop(name.upper(), None)
@@ -1,46 +1,62 @@
+# Parsers of GCS replies.
+# Replies are "key=value" items, one or more per line (KLT? separates them by
+# tabs). Each parser below scans the reply once: the per-axis replies (POS?,
+# ONT?, SVO?, FRF?) and KLT? with one split per line and a partition per item,
+# KET?, KEN? and WAV? with a precompiled pattern.
+import re
 from collections import OrderedDict
+import numpy as np
+
+# KET?: "KSD=name", KEN?: "name=KSD"
+_KET = re.compile(r'^[^=\n]*KSD[^=\n]*=[ \t]*(\S*)', re.M)
+_KEN = re.compile(r'^[ \t]*([^=\s]+)[ \t]*=[^\n]*KSD', re.M)
+# WAV?: "table param=value"
+_WAV = re.compile(r'^[ \t]*(\d+)[ \t]+(\d+)[ \t]*=[ \t]*(\S+)', re.M)
+# KLT? fields that are names, all the others are numbers
+_KLT_NAMES = ('Name', 'EndCoordinateSystem')
+_BOOL = {'1': True, '0': False}
 
 def decode_KEN(s):
     if isinstance(s, OrderedDict):
         for key, val in s.items():
             if val=='KSD':
                 return key
-    m = s.split('\n')
-    for l in m:
-        if 'KSD' in l:
-            f = l.split('=')
-            return f[0].strip()
+        return None
+    m = _KEN.search(s)
+    if m is None:
+        return None
+    return m.group(1)
 
 def decode_KET(s):
-    isNotfound = True
     if isinstance(s, OrderedDict):
         try:
             return s['KSD']
         except KeyError:
             return None
-    m = s.split('\n')
-    for l in m:
-        if 'KSD' in l:
-            f = l.split('=')
-            isNotfound = False
-            return f[1].strip()
-    if isNotfound:
+    m = _KET.search(s)
+    if m is None:
         return None
+    return m.group(1)
 
 def decode_KLT(s):
-    m = s.split('\n')
+    """KLT? -> [{'Name': 'ZERO', 'EndCoordinateSystem': 'ZERO', 'X': 0.0, ...}, ...]
+    one dict per coordinate system; names stay strings, the rest are floats."""
     cslist = []
-    for l in m:
+    for l in s.split('\n'):
+        if len(l)==0 or '=' not in l:
+            continue
         mydic = {}
-        fd = l.split('\t')
-        for f in fd:
-            kv = f.split('=')
-            if len(kv)==2:
-                val =  str2num(kv[1])
-                if val==None:
-                    mydic[kv[0]]=kv[1].strip()
-                else:
-                    mydic[kv[0]]=val
+        for f in l.split('\t'):
+            key, eq, val = f.partition('=')
+            if len(eq)==0:
+                continue
+            if key in _KLT_NAMES:
+                mydic[key] = val.strip()
+            else:
+                try:
+                    mydic[key] = float(val)
+                except ValueError:
+                    mydic[key] = val.strip()
         cslist.append(mydic)
     return cslist
 
@@ -50,26 +66,98 @@ def str2num(x):
     except ValueError:
         return None
 
+def decode_axes(s, conv=float):
+    """'X=1 \\nY=2\\n' to OrderedDict([('X', conv('1')), ('Y', conv('2'))])"""
+    d = OrderedDict()
+    for l in s.split('\n'):
+        key, eq, val = l.partition('=')
+        if len(eq)>0:
+            d[key.strip()] = conv(val.strip())
+    return d
+
+def _bool(x):
+    return _BOOL.get(x, x)
+
 def decode_ONT(s):
-    m = s.split('\n')
-    #cslist = []
+    """ONT? -> {'X': True, ...}; values other than 1 and 0 are kept as strings"""
     mydic = {}
-    for l in m:
-        kv = l.split('=')
-        if len(kv)==2:
-            valstr = kv[1].strip()
-            if valstr=='1':
-                val = True
-            elif valstr =='0':
-                val = False
-            else:
-                val = valstr
-#            val =  str2num(kv[1])
-#            print(val)
-            mydic[kv[0]]=val
-            #if val==None:
-            #    mydic[kv[0]]=kv[1].strip()
-            #else:
-            #    mydic[kv[0]]=val
-    #cslist.append(mydic)
-    return mydic    
\ No newline at end of file
+    for l in s.split('\n'):
+        key, eq, val = l.partition('=')
+        if len(eq)>0:
+            val = val.strip()
+            mydic[key.strip()] = _BOOL.get(val, val)
+    return mydic
+
+def decode_POS(s):
+    """POS? -> OrderedDict([('X', 0.0), ...])"""
+    return decode_axes(s, float)
+
+def decode_SVO(s):
+    """SVO? -> OrderedDict([('X', True), ...])"""
+    return decode_axes(s, _bool)
+
+def decode_FRF(s):
+    """FRF? -> OrderedDict([('X', True), ...])"""
+    return decode_axes(s, _bool)
+
+def decode_WAV(s):
+    """WAV? -> OrderedDict({table: OrderedDict({parameter: value})}), e.g. wav[1][1] is the length of table 1"""
+    wav = OrderedDict()
+    for table, param, val in _WAV.findall(s):
+        wav.setdefault(int(table), OrderedDict())[int(param)] = int(float(val))
+    return wav
+
+# record tables of reset_record_table: (axis, DRC option) per column, 1 target, 2 real position
+RECORD_CHANNELS = [(ax, opt) for ax in ['X', 'Y', 'Z', 'U', 'V', 'W'] for opt in (1, 2)]
+
+def decode_DRC(s):
+    """DRC? -> [(axis, option), ..] of the record tables from 1 on that record a target (1)
+    or real (2) position, as configure_recorder puts them before any other"""
+    channels = []
+    for table, cfg in decode_axes(s, str.split).items():
+        if len(cfg) != 2 or cfg[1] not in ('1', '2') or cfg[0] == '0':
+            break
+        channels.append((cfg[0], int(cfg[1])))
+    return channels
+
+def decode_DRR_table(s):
+    """DRR? reply -> (sample time or None, (samples, DIM) array) without copies of the data"""
+    sample_time = None
+    ncols = 12
+    # header: the leading lines starting with '#'
+    head = 0
+    while s.startswith('#', head):
+        end = s.find('\n', head)
+        if end < 0:
+            end = len(s)
+        key, _, val = s[head+1:end].partition('=')
+        key = key.strip()
+        if key == 'SAMPLE_TIME':
+            sample_time = float(val)
+        elif key == 'DIM':
+            ncols = int(val)
+        head = end+1
+    # the data block in one go
+    values = np.fromstring(s[head:], sep=' ') if head < len(s) else np.zeros(0)
+    nrows = values.size//ncols
+    # an incomplete last row is dropped.
+    return sample_time, values[:nrows*ncols].reshape(nrows, ncols)
+
+def decode_DRR(s, channels=None):
+    # DRR? reply of the record tables given by channels (default RECORD_CHANNELS)
+    # returns {'Sample Time': dt, 'X': (target, real), ..., 'W': (target, real),
+    #          'Data': (samples, columns) array}; the per-axis arrays are views of 'Data'.
+    # an axis recorded with one quantity only has None for the other.
+    data = {}
+    sample_time, table = decode_DRR_table(s)
+    if sample_time is not None:
+        data['Sample Time'] = sample_time
+    data['Data'] = table
+    if channels is None:
+        channels = RECORD_CHANNELS
+    for i, (ax, opt) in enumerate(channels[:table.shape[1]]):
+        pair = list(data.get(ax, (None, None)))
+        if opt in (1, 2):
+            pair[opt-1] = table[:, i]
+        data[ax] = tuple(pair)
+    return data
@@ -6,11 +6,23 @@
 # KLN CS1 CS2: set CS2 to be a parent of CS1
 # KEN CSname: enable CSname
 import time
-from .decode import decode_KET, decode_KLT, decode_ONT
-from collections import OrderedDict
+from .decode import decode_ONT, decode_WAV, decode_axes, decode_DRR_table, RECORD_CHANNELS
+from .record import Record
+from .plot import RecordPlot
+from .commands import wav_points, MAX_LINE_LENGTH
+from .csregistry import CSRegistry
+from .transform import CSTree
+from .motion import MotionWatcher
+from .sampler import PositionSampler
+from .singleflight import SingleFlight
+from .status import Status, STATUS_QUERIES
+from .wavecache import WaveCache, program_length
+from .wavealloc import WaveAllocator, trajectory_key, retarget
+from .wavefit import fit_commands
+from .wavemodel import WaveModel
 import numpy as np
-import matplotlib.pyplot as plt
 import threading
+from contextlib import contextmanager
 from pipython import gcserror
 
 IP = '10.54.122.145'
@@ -19,6 +31,10 @@ WaveGenID = {"X": 1, "Y": 2, "Z":3, "U": 4, "V": 5, "W": 6}
 #X_WAVETABLE_ID = 1
 SNAKE_X_WAVETABLE_ID = 13
 SNAKE_Y_WAVETABLE_ID = 14
+NUMBER_OF_WAVE_TABLES = 16
+NUMBER_OF_RECORD_TABLES = 16
+# DRC options of configure_recorder
+RECORD_OPTIONS = {'target': 1, 'real': 2}
 
 # WaveGenID for this hexapod is defined as below:
 #   1 ~ 8. 1 for X, 2 for Y, 3 for Z, 4 for U, 5 for V, and 6 for W. 7 and 8 are not defined.
@@ -26,23 +42,24 @@ SNAKE_Y_WAVETABLE_ID = 14
 class WAV_Exception(Exception):
     pass
 
-def plot_record(data, axis='X'):
-    '''Plot results from get_records'''
-    if isinstance(data, type({})):
+def plot_record(data, axis='X', width=2000, block=True):
+    '''Plot results from get_records, decimated to width bins (pihexapod.plot).
+    data: one record or a list of them. axis: 'X', or several axes as 'XZ'.
+    block=False returns the RecordPlot without waiting for the window to close.'''
+    if isinstance(data, (dict, Record)):
         l_data = [data]
     else:
         l_data = data
+    p = RecordPlot(axis, width)
     for data in l_data:
-        ndata = data[axis][0].size
-        plt.plot(range(0, ndata), (data[axis][1]-data[axis][0])*1000000)
-        
-    plt.ylabel('Real - Target (nm)')
-    plt.xlabel(f"Time (/{data['Sample Time']} s)")
-    plt.show()
+        p.plot(data)
+    p.show(block)
+    return p
 
 class Hexapod:
     """A class to use pipython"""
-    def __init__(self, IPorBasePV, UserCS = "PTYCHO"):
+    def __init__(self, IPorBasePV, UserCS = "PTYCHO", use_asyncio=False):
+        # use_asyncio: for a direct connection, use the asyncio client of aiogcs instead of pipython.
         _direct_connection_needed = False
         if len(IPorBasePV) == 0: # will use InterfaceSetupDlg
             _direct_connection_needed = True
@@ -50,7 +67,13 @@ class Hexapod:
             _m = IPorBasePV.split('.')
             if len(_m)==4:
                 _direct_connection_needed = True
-        if _direct_connection_needed:
+        if _direct_connection_needed and use_asyncio:
+            from .aiogcs import ThreadedHexapod as hp
+            self.pidev = hp(IPorBasePV)
+            self.pidev.connect()
+            self.isEPICS = False
+            print("C887 is connected directly with asyncio. Check wth .pidev.")
+        elif _direct_connection_needed:
             from .pigcs import Hexapod as hp
             self.pidev = hp(IPorBasePV)
             self.pidev.connect()
@@ -66,22 +89,92 @@ class Hexapod:
         self.mycs = UserCS
         self.axes = ['X', 'Y', 'Z', 'U', 'V', 'W']
         self.wave_start = {'X':0, 'Y':0, 'Z':0, 'U':0, 'V':0, 'W':0}
-        self.lock = threading.Lock()
+        self.lock = threading.RLock()
+        # KLT?/KET? cache, see refresh_CS()
+        self.csreg = CSRegistry(self.axes)
+        # shared ONT? poller behind mv() and wait()
+        # concurrent identical queries share one reply. query_ttl: seconds a reply
+        # is reused after it arrived, e.g. h.query_ttl['POS?'] = 0.02
+        self.flight = SingleFlight()
+        self.query_ttl = {'POS?': 0, 'ONT?': 0, 'FRF?': 0, 'SVO?': 0}
+        # ONT? of the poller is never shared, it must be sent after the MOV it waits for.
+        self.motion = MotionWatcher(self._qONT)
+        # background POS? sampler, see start_sampler()
+        self.sampler = None
+        # what the data recorder tables 1, 2, .. hold, see configure_recorder()
+        self.record_channels = list(RECORD_CHANNELS)
+        self.record_rate = 1
+        # wave table and trigger programs already in the controller
+        self.wavecache = WaveCache()
+        # what those programs compute to, and the wave table selected for each axis (WSL)
+        self.wavemodel = WaveModel()
+        self.wave_selection = {}
+        # which table holds which trajectory; the IDs above are only the first choice.
+        self.wavealloc = WaveAllocator(range(1, NUMBER_OF_WAVE_TABLES+1))
+        self.traj_tables = {}   # axis -> (table of direction, table of -direction) of set_traj
+        self.snake_tables = (SNAKE_X_WAVETABLE_ID, SNAKE_Y_WAVETABLE_ID)
 
     def disconnect(self):
+        self.stop_sampler()
         if self.isEPICS == False:
             self.pidev.close()
     
     def connect(self):
         self.pidev.connect()
+        # the controller may have been changed or restarted meanwhile.
+        self.csreg.invalidate()
+        self.wavecache.invalidate()
+        self.wavemodel.forget()
+        self.wavealloc.clear()
+
+    @contextmanager
+    def pipeline(self):
+        """commands sent in the block are streamed back-to-back and their errors are checked
+        once at the end, when the transport supports it.
+        with h.pipeline():
+            h.set_wav_LIN(...)
+            h.set_pulses(...)
+        """
+        try:
+            if hasattr(self.pidev, 'pipeline'):
+                with self.pidev.pipeline():
+                    yield
+            else:
+                yield
+        except Exception:
+            # a pipelined KSD/KLN/KEN/KRM or WAV/TWS may have failed.
+            self.csreg.invalidate()
+            self.wavecache.invalidate()
+            self.wavemodel.forget()
+            raise
+
+    def send_commands(self, cmds):
+        """send cmds in order. Consecutive DRC, WSL, WGC, CTO or TWS commands are merged
+        into as few lines as the transport accepts (see commands.coalesce)."""
+        if hasattr(self.pidev, 'pipeline'):
+            with self.pidev.pipeline():
+                for cmd in cmds:
+                    self.pidev.send_command(cmd)
+        else:
+            # EPICS: lines no longer than AOUT takes
+            self.pidev.send_commands(cmds)
+
+    @property
+    def command_count(self):
+        """(GCS commands sent, command lines written) since connecting"""
+        return (getattr(self.pidev, 'commands_sent', 0), getattr(self.pidev, 'lines_written', 0))
+
+    def _query(self, cmd, func):
+        # one func() for all threads asking cmd at the same time
+        return self.flight.do(cmd, func, self.query_ttl.get(cmd, 0))
 
     def is_referenced(self):
         """check if referenced"""
         strv = ''
         if self.isEPICS:
-            strv = self.pidev.qFRF()
+            strv = self._query('FRF?', self.pidev.qFRF)
         else:
-            strv = self.pidev.qFRF()
+            strv = self._query('FRF?', self.pidev.qFRF)
         if strv is None:
             raise ValueError("Connecion is failed.")
         return strv
@@ -90,9 +183,9 @@ class Hexapod:
         """check if referenced"""
         strv = ''
         if self.isEPICS:
-            strv = self.pidev.qSVO()
+            strv = self._query('SVO?', self.pidev.qSVO)
         else:
-            strv = self.pidev.qSVO()
+            strv = self._query('SVO?', self.pidev.qSVO)
         if strv is None:
             raise ValueError("Connecion is failed.")
         if len(axis)>0:
@@ -104,6 +197,7 @@ class Hexapod:
             self.pidev.FRF()
         else:
             self.pidev.FRF()
+        self.flight.forget()
     
     def set_UserDefaultCSname(self, CS):
         self.mycs = CS
@@ -113,6 +207,8 @@ class Hexapod:
             csval = self.get_mycsinfo('ZERO')
         else:
             csval = self.get_mycsinfo(cs)
+        if csval is None:
+            raise KeyError(f"No coordinate system {cs}.")
         del csval['Name']
         del csval['EndCoordinateSystem']
         self.axes = list(csval.keys())
@@ -127,23 +223,39 @@ class Hexapod:
         #     allaxes = list(csval.keys())
         # return allaxes
 
+    def refresh_CS(self):
+        """re-read KLT? and KET? into the coordinate system cache"""
+        with self.lock:
+            self.csreg.load_KLT(self.pidev.qKLT())
+            self.csreg.load_KET(self.pidev.qKET())
+
+    def _cs_command(self, func, *args, **kwargs):
+        # send KSD/KLN/KEN/KRM. The cache is dropped when the controller refuses it.
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            self.csreg.invalidate()
+            raise
+
     def get_allcs(self):
         with self.lock:
-            _s = self.pidev.qKLT()
-            _v = decode_KLT(_s)
-    #        for _m in _v:
-    #            print(_m)
-            return _v
+            if self.csreg.systems is None:
+                self.csreg.load_KLT(self.pidev.qKLT())
+            return self.csreg.allcs()
 
     def get_mycsinfo(self, cs=""):
         with self.lock:
             if len(cs)==0:
                 cs = self.get_CS()
                 self.mycs = cs
-            _s = self.get_allcs()
-            for _m in _s:
-                if _m['Name'] == cs:
-                    return _m
+            if self.csreg.systems is None:
+                self.get_allcs()
+            return self.csreg.get(cs)
+
+    def convert_poses(self, poses, src, dst='ZERO'):
+        """convert poses, an (N, 6) array of X, Y, Z, U, V, W in the coordinate system src,
+        to dst on the host with the cached KLT? values. No CS is activated."""
+        return CSTree(self.get_allcs()).convert(poses, src.upper(), dst.upper())
 
     def print_return(self, ret):
         _m = ret.split('\n')
@@ -153,13 +265,14 @@ class Hexapod:
     def activate_CS(self, CS):
         # activate the coordinate system CS
         with self.lock:
-            self.pidev.KEN(CS)
+            self._cs_command(self.pidev.KEN, CS)
+            self.csreg.KEN(CS)
 
     def get_KET(self):
-        strv = ''
         with self.lock:
-            strv = self.pidev.qKET()
-            return decode_KET(strv)
+            if not self.csreg.active_loaded:
+                self.csreg.load_KET(self.pidev.qKET())
+            return self.csreg.active
 
     def get_CS(self):
         """get the name of activated coordination system"""
@@ -181,7 +294,8 @@ class Hexapod:
         if ccs==csname:
             self.set_default_CS()
         with self.lock:
-            self.pidev.KRM(csname)
+            self._cs_command(self.pidev.KRM, csname)
+            self.csreg.KRM(csname)
 
     def set_default_CS(self):
         """activate ZERO"""
@@ -190,7 +304,8 @@ class Hexapod:
     def linkCS(self, cs, parent):
         """linking a child to a parent"""
         with self.lock:
-            self.pidev.KLN(cs, parent)
+            self._cs_command(self.pidev.KLN, cs, parent)
+            self.csreg.KLN(cs, parent)
 
     def add_CS(self, **kwargs):  # define new coordinate system.
         """adding a new coordination system, arguments: csname, parent, X, Y, Z, U, V, W"""
@@ -249,7 +364,8 @@ class Hexapod:
                 for key2, value2 in value.items():
                     csval[key2] = value2
         with self.lock:
-            self.pidev.KSD(csname=_cs, **csval)
+            self._cs_command(self.pidev.KSD, csname=_cs, **csval)
+            self.csreg.KSD(_cs, **csval)
 
         if _qcs:
             time.sleep(0.1)
@@ -281,21 +397,27 @@ class Hexapod:
             pnts4speedupdown = pulse_start
             pulse_rising_edge_position.append(pulse_start)
         else:
-            self.TWC()
             pulseN = 1
             pulse_rising_edge_position = [pulse_start]
             pnts4speedupdown = pulse_start
 
         if Npnts>0:
             try:
+                cmds = []
                 while pulse_start < Npnts:
                     # TWS TriggerOutputChannle WaveletPosition Switch TriggerOutputChannle WaveletPosition Switch
-                    self.pidev.send_command(f"TWS {channel} {pulse_start} 2 {channel} {pulse_start+pulse_width} 3")
+                    cmds.append(f"TWS {channel} {pulse_start} 2 {channel} {pulse_start+pulse_width} 3")
                     pulse_start = pulse_start + pulse_period
                     if pulse_start > self.wave_pnts - pnts4speedupdown:
                         break
                     pulse_rising_edge_position.append(int(pulse_start))
                     #pulseN = pulseN + 1
+                if append:
+                    self.send_commands(cmds)
+                    self.wavecache.triggers = None
+                    self.wavemodel.set_triggers(cmds, append=True)
+                else:
+                    self._load_triggers(cmds)
                 pulseN = len(pulse_rising_edge_position)
                 print(f"{pulseN} number of pulses will be generated.")
             except gcserror.GCSError:
@@ -308,22 +430,63 @@ class Hexapod:
     def allocate_pulses(self, channel=1, pulse_width=1):
         # channel: output channel 1 through 4, default is 1 since hardware is connected to 1.
         # self.pidev.send_command(f"TWS {channel} {p} 2 {channel} {p+pulse_width} 3")
-        self.TWC()
         pos = self.pulse_positions_index
-        cmd = 'TWS'
-        cmdstr = cmd
-        for i, p in enumerate(pos):
-            cmdstr = f'{cmdstr} {channel} {p} 2 {channel} {p+pulse_width} 3'
-            if i%50 == 0:
-                #print(cmdstr)
-                self.pidev.send_command(cmdstr)
-                cmdstr = cmd
-        if len(cmdstr)>5:
-            self.pidev.send_command(cmdstr)
-            # try:
-            #     self.pidev.send_command(f"TWS {channel} {p} 2 {channel} {p+pulse_width} 3")
-            # except gcserror.GCSError:
-            #     print("Cannot clear triggers.\n")
+        # one TWS per pulse; send_commands packs them into full lines.
+        self._load_triggers([f"TWS {channel} {p} 2 {channel} {p+pulse_width} 3" for p in pos])
+
+    def _wave_loaded(self, table, cmds, wavelen=None):
+        # True if the WAV commands cmds are what table already holds (see wavecache)
+        if table not in self.wavecache.tables:
+            return False
+        if wavelen is None:
+            wavelen = self.get_wavelen()
+        return self.wavecache.table_loaded(table, cmds, wavelen)
+
+    def _upload_wave(self, table, cmds, values=None):
+        self.wavecache.invalidate(table)
+        self.wavemodel.forget(table)
+        self.send_commands(cmds)
+        self.wavecache.store_table(table, cmds)
+        self.wavemodel.set_table(table, cmds, values)
+
+    def _tables_in_use(self):
+        # tables a wave generator is set to (WSL) or that hold the last set_traj/SNAKE
+        # trajectories; wavealloc must not give them up for another one.
+        tables = set(self.wave_selection.values()) | set(self.snake_tables)
+        for pair in self.traj_tables.values():
+            tables.update(pair)
+        return tables
+
+    def _load_trajectory(self, cmds, prefer=None, pinned=(), values=None):
+        # put the WAV program cmds (written for any table) in a table chosen by wavealloc,
+        # prefer if it is free, and upload it unless it is there already. returns the table.
+        # pinned: tables not to give up, besides those in use.
+        pinned = set(pinned) | self._tables_in_use()
+        key = trajectory_key(cmds)
+        points = program_length(cmds)
+        if self.wavealloc.lookup(key) is None:
+            # WMS? is the limit of each table
+            if points>self.qWMS():
+                raise WAV_Exception("Too long wave.")
+        try:
+            table, evicted = self.wavealloc.allocate(key, points, prefer, pinned)
+        except MemoryError as e:
+            raise WAV_Exception(str(e)) from e
+        for t in evicted:
+            self.wavecache.invalidate(t)
+            self.wavemodel.forget(t)
+        cmds = retarget(cmds, table)
+        if not self._wave_loaded(table, cmds):
+            self._upload_wave(table, cmds, values)
+        return table
+
+    def _load_triggers(self, cmds):
+        # TWC and the TWS commands cmds, unless they are what the controller already has
+        if not self.wavecache.triggers_loaded(cmds):
+            self.TWC()
+            self.send_commands(cmds)
+            self.wavecache.store_triggers(cmds)
+        self.wavemodel.set_triggers(cmds)
         
     def make_pulse_arrays(self, pulse_start=1, pulse_period=100, pulse_end = 0, append=False):
         # channel: output channel 1 through 4
@@ -370,12 +533,9 @@ class Hexapod:
         if number_of_lines%2 !=0:
             number_of_lines+=1
         #print(f"number_of_lines is {number_of_lines}")
-        totalpnts = time_per_line/sec4pnt*number_of_lines
         totalpnts4line0 = time_per_line/sec4pnt
         totalpnts4line = totalpnts4line0 + speed_up_down
         N_round = int(number_of_lines/2) # the number of lines should be even number...
-        if totalpnts>self.qWMS():
-            raise WAV_Exception("Too long wave.")
         if direction == 1:
             wavetableID4X = SNAKE_X_WAVETABLE_ID
             wavetableID4Y = SNAKE_Y_WAVETABLE_ID
@@ -386,13 +546,14 @@ class Hexapod:
         skip_position = speed_up_down/2
         self.scantime = N_round*totalpnts4line*2*sec4pnt
 
+        xcmds = []
         for i in range(N_round):
             if i==0:
                 isappend = 'X'
             else:
                 isappend = '&'
             cmd = f"WAV {wavetableID4X} {isappend} RAMP {totalpnts4line*2} {X_distance+2*radius:.5e} {start_X0-radius} {totalpnts4line*2} 0 {speed_up_down} {totalpnts4line}"
-            self.pidev.send_command(cmd)
+            xcmds.append(cmd)
             if i==0:
                 isappend = False
             else:
@@ -411,28 +572,33 @@ class Hexapod:
         Y_target0 = start_Y0
         Y_step = Y_step * direction
 
-        for i in range(N_round):
-            if i==0: # first radius
-                cmd = f"WAV {wavetableID4Y} X LIN {speed_up_down/2} 0 {Y_target0:.5e} {speed_up_down/2} 0 0"
-                self.pidev.send_command(cmd)
-            # flat for +X
-            cmd = f"WAV {wavetableID4Y} & LIN {totalpnts4line0} 0 {Y_target0:.5e} {totalpnts4line0} 0 0"
-            self.pidev.send_command(cmd)
-            # curve up at +X end
-            cmd = f"WAV {wavetableID4Y} & LIN {speed_up_down} {Y_step:.5e} {Y_target0} {speed_up_down} 0 {int(speed_up_down/3)}"
-            self.pidev.send_command(cmd)
-            Y_target0 = Y_target0 + Y_step
-            # flat for -X
-            cmd = f"WAV {wavetableID4Y} & LIN {totalpnts4line0} 0 {Y_target0:.5e} {totalpnts4line0} 0 0"
-            self.pidev.send_command(cmd)
-            # curve up at -X end
-            if i<N_round-1:
+        ycmds = []
+        with self.pipeline():
+            for i in range(N_round):
+                if i==0: # first radius
+                    cmd = f"WAV {wavetableID4Y} X LIN {speed_up_down/2} 0 {Y_target0:.5e} {speed_up_down/2} 0 0"
+                    ycmds.append(cmd)
+                # flat for +X
+                cmd = f"WAV {wavetableID4Y} & LIN {totalpnts4line0} 0 {Y_target0:.5e} {totalpnts4line0} 0 0"
+                ycmds.append(cmd)
+                # curve up at +X end
                 cmd = f"WAV {wavetableID4Y} & LIN {speed_up_down} {Y_step:.5e} {Y_target0} {speed_up_down} 0 {int(speed_up_down/3)}"
-                self.pidev.send_command(cmd)
+                ycmds.append(cmd)
                 Y_target0 = Y_target0 + Y_step
-            else:
-                cmd = f"WAV {wavetableID4Y} & LIN {speed_up_down/2} 0 {Y_target0:.5e} {speed_up_down/2} 0 0"
-                self.pidev.send_command(cmd)
+                # flat for -X
+                cmd = f"WAV {wavetableID4Y} & LIN {totalpnts4line0} 0 {Y_target0:.5e} {totalpnts4line0} 0 0"
+                ycmds.append(cmd)
+                # curve up at -X end
+                if i<N_round-1:
+                    cmd = f"WAV {wavetableID4Y} & LIN {speed_up_down} {Y_step:.5e} {Y_target0} {speed_up_down} 0 {int(speed_up_down/3)}"
+                    ycmds.append(cmd)
+                    Y_target0 = Y_target0 + Y_step
+                else:
+                    cmd = f"WAV {wavetableID4Y} & LIN {speed_up_down/2} 0 {Y_target0:.5e} {speed_up_down/2} 0 0"
+                    ycmds.append(cmd)
+            tx = self._load_trajectory(xcmds, wavetableID4X)
+            ty = self._load_trajectory(ycmds, wavetableID4Y, pinned=(tx,))
+        self.snake_tables = (tx, ty)
         self.wave_start['X'] = start_X0
         self.wave_start['Z'] = start_Y0
         #self.wave_speed = totaltravel/totaltime
@@ -442,6 +608,7 @@ class Hexapod:
         self.set_wav_LIN(totaltime, totaltravel, startposition, pnts4speedupdown, direction)
 
     def set_wav_LIN(self, totaltime=5, totaltravel=5, startposition=-2.5, pnts4speedupdown=10, direction=1, axis = 'X'):
+        # returns the wave table ID used.
         if direction==1:
             wavetableID = WaveGenID[axis]
         else:
@@ -455,8 +622,10 @@ class Hexapod:
         totalpnts = totaltime/sec4pnt
         #print(f"total time is {totaltime}, sec4pnt is {sec4pnt}, and totalpnts is {totalpnts}, pnts4down is {pnts4speedupdown}")
         totalpnts = totalpnts + pnts4speedupdown*2
-        if totalpnts>self.qWMS():
-            raise WAV_Exception("Too long wave.")
+        # WAVE (WaveTableID, X, type) # X means clear the table.
+        cmd = f"WAV {wavetableID} X LIN {totalpnts} {totaltravel:.5e} {startposition} {totalpnts} 0 {pnts4speedupdown}"
+        #self.pidev.WAV_LIN(1, 0, totalpnts, 'X', pnts4speedupdown, totaltravel, startposition, totalpnts)
+        wavetableID = self._load_trajectory([cmd], wavetableID)
 
         #print(f"totalpnts = {totalpnts}, startposition={startposition}, totaltravel={totaltravel}")
         #self.wave_x = direction*np.arange(totalpnts)
@@ -467,15 +636,46 @@ class Hexapod:
         self.wave_accelpoints = pnts4speedupdown
         #print(f"totaltravel is {totaltravel}, and totaltime is {totaltime}, and speed is {self.wave_speed}")
 
-        #self.pidev.WAV_LIN(1, 0, totalpnts, 'X', pnts4speedupdown, totaltravel, startposition, totalpnts)
-        # WAVE (WaveTableID, X, type) # X means clear the table.
-        cmd = f"WAV {wavetableID} X LIN {totalpnts} {totaltravel:.5e} {startposition} {totalpnts} 0 {pnts4speedupdown}"
-        self.pidev.send_command(cmd)
 #        print(cmd)
 
         #self.pidev.WGC(WaveGenID, number of cycles to run) # run only 1 time
         self.pidev.send_command(f"WGC {WaveGenID[axis]} 1")
+        return wavetableID
     
+    def set_wav_points(self, axis, positions, wavetableID=0, tol=None):
+        """load positions (mm, one per servo cycle of 1 ms) into a wave table with WAV PNT.
+        wavetableID: 0 for a table chosen by wavealloc, the one of the axis (WaveGenID) if it is free.
+        returns the wave table ID used.
+        The points are sent pipelined, in lines of up to commands.MAX_LINE_LENGTH characters
+        (fewer over EPICS, as many as AOUT takes).
+        tol: if given (mm), send LIN/RAMP segments within tol of the positions instead
+        (see wavefit), unless they are longer than the points."""
+        table = wavetableID if wavetableID else WaveGenID[axis]
+        positions = np.asarray(positions, dtype=float).ravel()
+        if len(positions) == 0:
+            raise WAV_Exception("No points.")
+        # one character spare: wavealloc may retarget the lines to a two-digit table
+        cmds = wav_points(table, positions, getattr(self.pidev, 'max_line_length', MAX_LINE_LENGTH) - 1)
+        values = positions
+        if tol is not None:
+            segs = fit_commands(table, positions, tol)
+            if sum(map(len, segs)) < sum(map(len, cmds)):
+                cmds = segs
+                values = None
+        with self.pipeline():
+            if wavetableID == 0:
+                table = self._load_trajectory(cmds, table, values=values)
+            elif not self._wave_loaded(table, cmds):
+                if len(positions)>self.qWMS():
+                    raise WAV_Exception("Too long wave.")
+                self._upload_wave(table, cmds, values)
+                self.wavealloc.claim(table, trajectory_key(cmds), len(positions))
+            self.pidev.send_command(f"WGC {WaveGenID[axis]} 1")
+        self.wave_pnts = len(positions)
+        self.wave_start[axis] = positions[0]
+        self.wave_accelpoints = 0
+        return table
+
     def assign_axis2wavtable(self, axes, wavetableIDs):
         # # associate the table number to the axis
         # self.pidev.send_command(f"WSL {WaveGenID['X']} {wavetableID4X} {WaveGenID['Z']} {wavetableID4Y}")
@@ -483,29 +683,28 @@ class Hexapod:
         # self.pidev.send_command(f"WGC {WaveGenID['X']} 1 {WaveGenID['Z']} 1")
 
         #self.pidev.WSL(WaveGenID, waveTableID) # assign wavelet 1 to the X axis.
-        wslcmdstr = 'WSL'
-        wgccmdstr = 'WGC'
         if type(axes) != type([1,2]):
             axes = [axes]
             wavetableIDs = [wavetableIDs]
+        cmds = [f"WSL {WaveGenID[axis]} {wavetableIDs[i]}" for i, axis in enumerate(axes)]
+        cmds = cmds + [f"WGC {WaveGenID[axis]} 1" for axis in axes]
+        self.send_commands(cmds)
         for i, axis in enumerate(axes):
-            wslcmdstr = f"{wslcmdstr} {WaveGenID[axis]} {wavetableIDs[i]}"
-            wgccmdstr = f"{wgccmdstr} {WaveGenID[axis]} 1"
-        self.pidev.send_command(wslcmdstr)
-        self.pidev.send_command(wgccmdstr)
+            self.wave_selection[axis] = wavetableIDs[i]
         #self.pidev.send_command(f"WSL {WaveGenID[axis]} {wavetableID}")
 
     def clear_Wave_Table_assignment(self):
-        for axis in WaveGenID:
-            self.pidev.send_command(f"WSL {WaveGenID[axis]} 0")
+        self.send_commands([f"WSL {WaveGenID[axis]} 0" for axis in WaveGenID])
+        self.wave_selection = {}
 
     def set_traj_SNAKE(self, time_per_line = 5, Xi = -2.5, X_distance=1, Yi = 0, Yf = 1, Y_step = 0.1, pulse_step=0.1):
-        self.set_wav_SNAKE(time_per_line, Xi, X_distance, Yi, Yf, Y_step, pulse_step, 1)
-        self.pulse_number = len(self.pulse_positions_index)
-        self.pulse_step = pulse_step # real distance in mm.
-        self.pidev.send_command("CTO 1 3 9")
-        self.allocate_pulses()
-        self.assign_axis2wavtable(['X', 'Z'], [SNAKE_X_WAVETABLE_ID, SNAKE_Y_WAVETABLE_ID])
+        with self.pipeline():
+            self.set_wav_SNAKE(time_per_line, Xi, X_distance, Yi, Yf, Y_step, pulse_step, 1)
+            self.pulse_number = len(self.pulse_positions_index)
+            self.pulse_step = pulse_step # real distance in mm.
+            self.pidev.send_command("CTO 1 3 9")
+            self.allocate_pulses()
+            self.assign_axis2wavtable(['X', 'Z'], list(self.snake_tables))
 
     def make_stepscan_arrays(self, Xi = -2.5, Xf=2.5, X_step = 0.1, Yi = 0, Yf = 1, Y_step = 0.1):
         xpos_all = np.array([])
@@ -525,16 +724,7 @@ class Hexapod:
     def step_scan_SNAKE(self, Xi, Xf, X_step, Yi, Yf, Y_step, exptime):
         xp, yp = self.make_stepscan_arrays(Xi, Xf, X_step, Yi, Yf, Y_step)
         for x, y in zip(xp, yp):
-            self.mv('X', x, 'Z', y)
-            status = False
-            while not status:
-                time.sleep(0.01)
-                try:
-                    state = self.isattarget()
-                    status = state['X'] and state['Z']
-                except:
-                    status = False
-                time.sleep(0.01)
+            self.mv('X', x, 'Z', y, wait=True)
             print(f"At X={x:.3f}, Z={y:.3f}, wait for {exptime} seconds.")
             time.sleep(exptime)
 
@@ -555,50 +745,50 @@ class Hexapod:
         pulse_period = abs(pulse_period_time)/0.001
         pulse_number = totaltime/abs(pulse_period_time)+1
         
-        for ind, axis in enumerate(axes):
-            # currently only for the first axis that is the X axis...
-            direc = direction[ind]
-            wave_speed = totaltravel[ind]/totaltime
-            #print(direc, " direction")
-            self.set_wav_LIN(totaltime, totaltravel[ind], startposition[ind], pnts4speedupdown, direction=direc, axis = axis)
-            self.set_wav_LIN(totaltime, totaltravel[ind], startposition[ind], pnts4speedupdown, direction=-1*direc, axis = axis)
-            dist = wave_speed*abs(pulse_period_time)*1000
-            print(f'For {axis}, it triggers {pulse_number} times in every {dist:.5e} um or %0.3f seconds.'% (totaltime/pulse_number))
-        self.set_pulses(pulse_start=pnts4speedupdown, pulse_width=1, pulse_period=pulse_period, wavetableID=WaveGenID[axis])
-        self.pulse_number = pulse_number
-        self.pulse_step = pulse_period_time
-        self.scantime = totaltime
-        self.pidev.send_command("CTO 1 3 9")
+        with self.pipeline():
+            for ind, axis in enumerate(axes):
+                # currently only for the first axis that is the X axis...
+                direc = direction[ind]
+                wave_speed = totaltravel[ind]/totaltime
+                #print(direc, " direction")
+                fwd = self.set_wav_LIN(totaltime, totaltravel[ind], startposition[ind], pnts4speedupdown, direction=direc, axis = axis)
+                rev = self.set_wav_LIN(totaltime, totaltravel[ind], startposition[ind], pnts4speedupdown, direction=-1*direc, axis = axis)
+                self.traj_tables[axis] = (fwd, rev)
+                dist = wave_speed*abs(pulse_period_time)*1000
+                print(f'For {axis}, it triggers {pulse_number} times in every {dist:.5e} um or %0.3f seconds.'% (totaltime/pulse_number))
+            self.set_pulses(pulse_start=pnts4speedupdown, pulse_width=1, pulse_period=pulse_period, wavetableID=self.traj_tables[axis][0])
+            # the wave generators run the tables of direction
+            self.assign_axis2wavtable(list(axes), [self.traj_tables[ax][0] for ax in axes])
+            self.pulse_number = pulse_number
+            self.pulse_step = pulse_period_time
+            self.scantime = totaltime
+            self.pidev.send_command("CTO 1 3 9")
+
+    def _wave_start(self, axis):
+        # first point of the table selected for the axis, from the wave model when it knows it
+        table = self.wave_selection.get(axis)
+        if table in self.wavemodel:
+            return self.wavemodel.start(table)
+        return self.wave_start[axis]
 
     def goto_start_pos(self, axes2run='X'):
-        if not hasattr(self, 'wave_start'):
-            for axis in axes2run:
-                wv = self.get_wavelet(WaveGenID[axis], 1)
-                self.wave_start[axis] = wv[0]
         #pos = self.get_pos()
         #if (pos['X']-self.wave_start)*1000000 > 200: # if off more than 200nm
         argv = []
         for axis in axes2run:
             argv.append(axis)
-            argv.append(self.wave_start[axis])
+            argv.append(self._wave_start(axis))
 #        self.set_speed(1) # set the speed 1mm/second.
 #        #time.sleep(0.1)
-        self.mv(*argv)
-        status = False
-        while not status:
-            time.sleep(0.025)
-            try:
-                state = self.isattarget()
-                status = state[axis]
-            except:
-                status = False
-            time.sleep(0.01)
-        return status
+        fut = self.mv(*argv)
+        if not fut:
+            return False
+        return fut.result()
     
     def run_traj(self, axes2run='X', wait=False):
         pos = self.get_pos()
         for axis in axes2run:
-            if pos[axis] != self.wave_start[axis]:
+            if pos[axis] != self._wave_start(axis):
                 print("Moving to the starting positions .... Wait.")
                 self.goto_start_pos(axes2run)
                 break
@@ -609,11 +799,15 @@ class Hexapod:
 
         wavegenerator_output_cmd = "WGO%s" % wavegenerator_output_cmd
         self.pidev.send_command(wavegenerator_output_cmd)
+        self.flight.forget()
         print(f"Run command '{wavegenerator_output_cmd}' is sent.")
         if wait:
             t0 = time.time()
             while (time.time()-t0)<self.scantime:
-                pos = self.get_pos()
+                if self.sampler is not None and self.sampler.running:
+                    _, pos = self.sampler.latest()
+                else:
+                    pos = self.get_pos()
                 print(pos)
                 time.sleep(0.5)
     
@@ -624,6 +818,7 @@ class Hexapod:
         for axis in self.axes2run:
             wavegenerator_output_cmd = '%s %i 0' %(wavegenerator_output_cmd, WaveGenID[axis])
         self.pidev.send_command("WGO%s"%wavegenerator_output_cmd)
+        self.flight.forget()
 
     ## added for waveform. 11/1/2023
     def qCTO(self):
@@ -653,16 +848,7 @@ class Hexapod:
         otherwise, it returns lengthes of all wavelets'''
         with self.lock:
             d = self.pidev.send_read_command('WAV?')
-        a = d.split('\n')
-        wav = OrderedDict()
-        
-        for arg in a:
-            if len(arg)>0:
-                b = arg.split(' ')
-                c = b[1].split('=')
-                val = OrderedDict()
-                val[int(c[0])] = int(c[1])
-                wav[int(b[0])] = val
+        wav = decode_WAV(d)
         # this will return {WaveTableID, {WaveParameterID, value}}
         if wavetableID >=0: 
             return wav[wavetableID][1]
@@ -675,18 +861,16 @@ class Hexapod:
             length = self.get_wavelen(waveletID)
         with self.lock:
             d = self.pidev.send_read_command(f'GWD? 1 {length} {waveletID}')
-    
-        v = d.split('\n')
-        dt = []
-        for l in v:
-            if len(l)==0:
-                continue
-            if l[0] == '#':
-                pass
-            #    print(l)
-            else:
-                dt.append(float(l))
-        return dt
+        _, table = decode_DRR_table(d)
+        return table[:, 0].tolist()
+
+    def check_wavemodel(self, waveletID):
+        '''largest difference between wavemodel and the wave table read with GWD?'''
+        model = self.wavemodel.values(waveletID)
+        wave = np.array(self.get_wavelet(waveletID))
+        if len(wave) != len(model):
+            return np.inf
+        return float(np.abs(wave - model).max()) if len(wave) else 0.0
 
     def qTWG(self):
         with self.lock:
@@ -704,34 +888,70 @@ class Hexapod:
     def TWC(self):
         with self.lock:
             self.pidev.send_command('TWC')
+        self.wavecache.triggers = None
+        self.wavemodel.triggers = {}
 
     def get_pos(self):
+        return self._query('POS?', self._get_pos)
+
+    def _get_pos(self):
         with self.lock:
             return self.pidev.get_pos()
     
-    def mv(self, *argv, **kwargs):
+    def status(self):
+        """FRF?, SVO?, KET?, POS? and ONT? written back-to-back and read together.
+        Returns an immutable status.Status; .ready tells if the hexapod can scan."""
+        t = time.time()
+        with self.lock:
+            if hasattr(self.pidev, 'send_read_commands'):
+                replies = self.pidev.send_read_commands(STATUS_QUERIES)
+            else:
+                # EPICS: one query per AOUT put
+                replies = [self.pidev.send_read_command(q) for q in STATUS_QUERIES]
+            self.csreg.load_KET(replies[2])
+        return Status.from_replies(t, replies)
+
+    def start_sampler(self, rate=20, size=10000, ont=False):
+        """sample POS? (and ONT? with ont=True) rate times per second in the background.
+        Read the samples with .sampler.latest() and .sampler.history()."""
+        self.stop_sampler()
+        self.sampler = PositionSampler(self.get_pos, self.qONT if ont else None,
+                                       rate=rate, size=size, axes=self.axes)
+        return self.sampler.start()
+
+    def stop_sampler(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def mv(self, *argv, wait=False, timeout=None):
         # move command
         # mv(X, 1.0, Y, 2.0, Z, 0.5)
         # mv(X, 1.0)
+        # returns a Future that becomes True when the moved axes are on target
+        # (TimeoutError after timeout seconds, by default self.motion.timeout = 60 s;
+        # the error of ONT? if it fails), or False if MOV is refused.
+        # with wait=True, it returns True once they are there.
         cmd = 'MOV'
         for arg in argv:
             cmd = cmd + ' %s' % arg
         try:
             with self.lock:
                 self.pidev.send_command(cmd)
-            if 'wait' in kwargs and kwargs['wait']:
-                self.wait()
-            return True
         except gcserror.GCSError as e:
             print(f"Error in moving: {e}")
             return False
-        
-    def wait(self):
-        pos_status = self.isattarget()
-        while not pos_status:
-            time.sleep(0.1)
-            pos_status = self.isattarget()
-        
+        finally:
+            self.flight.forget()
+        fut = self.motion.watch(argv[0::2], timeout)
+        if wait:
+            return fut.result()
+        return fut
+
+    def wait(self, timeout=None):
+        """wait until all axes are on target, at most timeout seconds (default: motion.timeout)"""
+        return self.motion.watch(self.axes, timeout).result()
+
+
     def handle_error(self):
         val = self.is_servo_on()
         if not val['X']:
@@ -745,91 +965,138 @@ class Hexapod:
         # 3 and 4: for Y
         # ..
         # 11 and 12: for W
+        # with configure_recorder(), only the configured tables are read.
         if Ndata == 0:
-            wave = self.get_wavelen()
-            Ndata = wave[13][1] # read the wavelet 1.
+            Ndata = self._record_length()
         with self.lock:
-            dt = self.pidev.send_read_command(f"DRR? 1 {Ndata} 1 2 3 4 5 6 7 8 9 10 11 12")
-        v = dt.split('\n')
-        Xt = []
-        Xr = []
-        Yt = []
-        Yr = []
-        Zt = []
-        Zr = []
-        Ut = []
-        Ur = []
-        Vt = []
-        Vr = []
-        Wt = []
-        Wr = []
-
-        data = {}
-        for l in v:
-            if len(l)==0:
-                continue
-            if l[0] == '#':
-                if 'SAMPLE_TIME' in l:
-                    v = l.split(' = ')
-                    data['Sample Time'] = float(v[1])
-            else:
-                n = l.split(' ')
-                Xt.append(float(n[0]))
-                Xr.append(float(n[1]))
-                Yt.append(float(n[2]))
-                Yr.append(float(n[3]))
-                Zt.append(float(n[4]))
-                Zr.append(float(n[5]))
-                Ut.append(float(n[6]))
-                Ur.append(float(n[7]))
-                Vt.append(float(n[8]))
-                Vr.append(float(n[9]))
-                Wt.append(float(n[10]))
-                Wr.append(float(n[11]))
-        data['X'] = (np.array(Xt), np.array(Xr))
-        data['Y'] = (np.array(Yt), np.array(Yr))
-        data['Z'] = (np.array(Zt), np.array(Zr))
-        data['U'] = (np.array(Ut), np.array(Ur))
-        data['V'] = (np.array(Vt), np.array(Vr))
-        data['W'] = (np.array(Wt), np.array(Wr))
-        return data
+            dt = self.pidev.send_read_command(f"DRR? 1 {Ndata} {self._record_tables()}")
+        return Record.from_DRR(dt, self.record_channels)
 
-    def isattarget(self, axis=""):
-        ret = False
-        while not ret:
+    def _record_length(self):
+        # points recorded for the wave table of the first recorded axis (WSL),
+        # or the SNAKE X table when none is selected
+        table = self.snake_tables[0]
+        for ax, _ in self.record_channels:
+            if ax in self.wave_selection:
+                table = self.wave_selection[ax]
+                break
+        wave = self.get_wavelen()
+        return -(-wave[table][1]//self.record_rate)
+
+    def _record_tables(self):
+        return ' '.join(str(i+1) for i in range(len(self.record_channels)))
+
+    def qDRL(self, table=1):
+        """number of points recorded so far in the record table"""
+        with self.lock:
+            r = self.pidev.send_read_command(f"DRL? {table}")
+        return int(float(decode_axes(r)[str(table)]))
+
+    def iter_records(self, Ndata=0, chunk=2000, interval=0.1, idle=10):
+        """read the recorder while the trajectory runs.
+        yields Records of up to chunk samples as they are recorded, with .offset
+        (also ['Offset']), the index of the first sample of the block, until Ndata samples are read,
+        or until the run has stopped: no new sample and all axes on target (ONT?).
+        Ndata: as in get_records. interval: seconds between two looks at the recorder (DRL?).
+        idle: stop anyway when no sample arrived for idle seconds (None: never).
+            for block in h.iter_records():
+                process(block['Data'])
+        """
+        if Ndata == 0:
+            Ndata = self._record_length()
+        offset = 0
+        t_last = time.time()
+        stalled = False     # the last look found no new sample
+        while True:
+            # ONT? before DRL?: if the axes were on target already, nothing is recorded after that DRL?.
+            stopped = stalled and offset > 0 and all(self._qONT().values())
+            n = min(self.qDRL(), Ndata)
+            if n > offset:
+                t_last = time.time()
+            elif stopped or (idle is not None and time.time() - t_last > idle):
+                return
+            stalled = n <= offset
+            while offset < n:
+                k = min(chunk, n - offset)
+                with self.lock:
+                    dt = self.pidev.send_read_command(f"DRR? {offset+1} {k} {self._record_tables()}")
+                block = Record.from_DRR(dt, self.record_channels, offset)
+                got = block.samples
+                if got == 0:
+                    break
+                offset += got
+                yield block
+            if offset >= Ndata:
+                return
+            # let the recorder fill the next block
+            time.sleep(interval)
+
+    def scan_metadata(self):
+        """the active CS, the wave table lengths and the parameters of the last set_traj/set_traj_SNAKE"""
+        meta = {'cs': self.get_CS(),
+                'wavelen': {str(k): v[1] for k, v in self.get_wavelen().items()},
+                'record_rate': self.record_rate}
+        for key in ('scantime', 'pulse_number', 'pulse_step', 'wave_pnts', 'wave_accelpoints',
+                    'number_of_lines', 'pulse_number_per_line', 'wave_start', 'axes2run'):
+            if hasattr(self, key):
+                meta[key] = getattr(self, key)
+        return meta
+
+    def save_records(self, archive, Ndata=0, name='', **meta):
+        """read the recorder and append it to archive (a pihexapod.archive.RecordArchive)
+        with scan_metadata(), the trigger indices and meta. returns the run number."""
+        record = self.get_records(Ndata)
+        info = self.scan_metadata()
+        info.update(meta)
+        triggers = getattr(self, 'pulse_positions_index', None)
+        return archive.append(record, info, triggers, name)
+
+    def qONT(self, retry=5):
+        """ONT? as {'X': True, ...}. A failed query is tried again up to retry times."""
+        return self._query('ONT?', lambda: self._qONT(retry))
+
+    def _qONT(self, retry=5):
+        for i in range(retry):
             try:
                 with self.lock:
                     r = self.pidev.send_read_command('ONT?')
-                ret = True
-            except:
-                ret = False
+                return decode_ONT(r)
+            except (gcserror.GCSError, TimeoutError, OSError):
+                if i == retry-1:
+                    raise
                 time.sleep(0.1)
-        if len(r)==0:
+
+    def isattarget(self, axis=""):
+        v = self.qONT()
+        if len(v)==0:
             return None
-        v = decode_ONT(r)
         if len(axis):
             return v[axis]
         else:
             return v['X'] & v['Y'] & v['Z'] & v['U'] & v['V'] & v['W']        
 
     def reset_record_table(self):
+        # target and real positions of all axes in tables 1 to 12, and DRC 13 1 8.
+        self.configure_recorder('XYZUVW', ('target', 'real'), rate=1, extra=[('1', 8)])
+
+    def configure_recorder(self, axes='XYZUVW', quantities=('target', 'real'), rate=1, extra=()):
+        """choose what the data recorder records, and so what get_records reads.
+        axes: e.g. 'XZ' for a SNAKE. quantities: 'target' (DRC option 1) and/or 'real' (option 2).
+        rate: record every rate-th servo cycle (RTR).
+        extra: (source, option) tables recorded after the axes but not read by get_records.
+            h.configure_recorder('XZ', rate=2)  # 4 tables, every other cycle
+        """
+        channels = [(ax, RECORD_OPTIONS[q]) for ax in axes for q in quantities]
+        tables = channels + list(extra)
+        if len(tables) > NUMBER_OF_RECORD_TABLES:
+            raise ValueError(f"The recorder has {NUMBER_OF_RECORD_TABLES} tables, {len(tables)} are asked.")
+        cmds = [f"DRC {i+1} {source} {option}" for i, (source, option) in enumerate(tables)]
+        cmds += [f"DRC {i} 0 0" for i in range(len(tables)+1, NUMBER_OF_RECORD_TABLES+1)]
+        cmds.append(f"RTR {rate}")
         with self.lock:
-            self.pidev.send_command('DRC 1 X 1')
-            self.pidev.send_command('DRC 2 X 2')
-            self.pidev.send_command('DRC 3 Y 1')
-            self.pidev.send_command('DRC 4 Y 2')
-            self.pidev.send_command('DRC 5 Z 1')
-            self.pidev.send_command('DRC 6 Z 2')
-            self.pidev.send_command('DRC 7 U 1')
-            self.pidev.send_command('DRC 8 U 2')
-            self.pidev.send_command('DRC 9 V 1')
-            self.pidev.send_command('DRC 10 V 2')
-            self.pidev.send_command('DRC 11 W 1')
-            self.pidev.send_command('DRC 12 W 2')
-            self.pidev.send_command('DRC 13 1 8')
-            self.pidev.send_command('DRC 14 0 0')
-            self.pidev.send_command('DRC 15 0 0')
-            self.pidev.send_command('DRC 16 0 0')
+            self.send_commands(cmds)
+        self.record_channels = channels
+        self.record_rate = rate
     
     def get_speed(self):
         # returns speed in mm/s 
@@ -855,9 +1122,12 @@ class Hexapod:
             self.pidev.send_command('VLS %f'%val)
 
     def get_snake_XZ(self):
+        tx, ty = self.snake_tables
+        if tx in self.wavemodel and ty in self.wavemodel:
+            return self.wavemodel.values(tx).tolist(), self.wavemodel.values(ty).tolist()
         try:
-            posX = self.get_wavelet(SNAKE_X_WAVETABLE_ID)
-            posZ = self.get_wavelet(SNAKE_Y_WAVETABLE_ID)
+            posX = self.get_wavelet(tx)
+            posZ = self.get_wavelet(ty)
         except:
             return [], []
         return posX, posZ
@@ -0,0 +1,139 @@
+# A soft IOC that emulates the asyn record used by pigcs_epics.
+# GCS commands written to {base}:asyn_1.AOUT are answered by the simulated
+# C-887 of pihexapod.simulator and the reply is placed in BINP/NORD.
+#
+#   python -m pihexapod.ioc --base 12idHXP --latency 0.01 --imax 4096
+#
+# Clients on the same host need
+#   EPICS_CA_ADDR_LIST=127.0.0.1 EPICS_CA_AUTO_ADDR_LIST=NO
+# Requires caproto (pip install caproto).
+import argparse
+import asyncio
+import threading
+from caproto import ChannelType
+from caproto.server import PVGroup, pvproperty
+from caproto.asyncio.server import start_server
+from .simulator import SimulatedController, AXES
+
+def unescape(s):
+    """translate the C escapes of AOUT, as the asyn record does"""
+    return s.encode('latin-1').decode('unicode_escape')
+
+class AsynRecord(PVGroup):
+    """The fields of an asyn record that pigcs_epics uses.
+    latency: seconds between the AOUT put and the reply appearing in BINP.
+    """
+    AOUT = pvproperty(value='', name='.AOUT', dtype=ChannelType.CHAR, max_length=4096,
+                      report_as_string=True)
+    BINP = pvproperty(value=b'', name='.BINP', dtype=ChannelType.CHAR, max_length=65536)
+    TINP = pvproperty(value='', name='.TINP', dtype=ChannelType.CHAR, max_length=40,
+                      report_as_string=True, read_only=True)
+    NORD = pvproperty(value=0, name='.NORD', read_only=True)
+    IMAX = pvproperty(value=4096, name='.IMAX')
+    OFMT = pvproperty(value='ASCII', name='.OFMT', dtype=ChannelType.ENUM,
+                      enum_strings=['ASCII', 'Hybrid', 'Binary'])
+    IFMT = pvproperty(value='ASCII', name='.IFMT', dtype=ChannelType.ENUM,
+                      enum_strings=['ASCII', 'Hybrid', 'Binary'])
+    IEOS = pvproperty(value='', name='.IEOS', dtype=ChannelType.STRING)
+    OEOS = pvproperty(value='', name='.OEOS', dtype=ChannelType.STRING)
+
+    def __init__(self, *args, controller=None, latency=0.0, imax=4096, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.controller = controller if controller is not None else SimulatedController()
+        self.latency = latency
+        self.imax = imax
+        self.puts = 0
+
+    @IMAX.startup
+    async def IMAX(self, instance, async_lib):
+        await instance.write(self.imax)
+
+    @AOUT.putter
+    async def AOUT(self, instance, value):
+        self.puts += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        text = unescape(value) + unescape(self.OEOS.value)
+        answer = ''
+        for line in text.splitlines():
+            reply = self.controller.execute(line)
+            if reply is not None:
+                answer = answer + reply
+        raw = answer.encode('cp1252')[:self.IMAX.value]
+        await self.NORD.write(len(raw))
+        await self.BINP.write(raw)
+        await self.TINP.write(answer[:39])
+        return value
+
+class IOC:
+    """Serve an AsynRecord as {base}:asyn_1 from a background thread.
+    coordinate_systems: number of extra coordinate systems to define, which sets the size of the KLT? reply.
+    """
+    def __init__(self, base='12idHXP', latency=0.0, imax=4096, coordinate_systems=0, **kwargs):
+        self.controller = SimulatedController(**kwargs)
+        for i in range(coordinate_systems):
+            self.controller.execute(f"KSD CS{i:04d} " + ' '.join(f"{ax} {0.001*i:.3f}" for ax in AXES))
+        self.record = AsynRecord(prefix=f"{base}:asyn_1", controller=self.controller,
+                                 latency=latency, imax=imax)
+        self.base = base
+        self.thread = None
+        self.loop = None
+        self.task = None
+
+    @property
+    def pvdb(self):
+        return self.record.pvdb
+
+    def _serve(self, ready):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.task = self.loop.create_task(start_server(self.pvdb, interfaces=['127.0.0.1']))
+        self.loop.call_soon(ready.set)
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.loop.close()
+
+    def start(self):
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self._serve, args=(ready,), daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join()
+        self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated asyn record for the C-887")
+    parser.add_argument('--base', default='12idHXP')
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds between AOUT put and reply")
+    parser.add_argument('--imax', type=int, default=4096, help="IMAX of the record")
+    parser.add_argument('--coordinate-systems', type=int, default=0, help="extra coordinate systems to define")
+    args = parser.parse_args()
+    ioc = IOC(args.base, latency=args.latency, imax=args.imax, coordinate_systems=args.coordinate_systems)
+    print(f"Serving {args.base}:asyn_1 ...")
+    ioc.start()
+    try:
+        ioc.thread.join()
+    except KeyboardInterrupt:
+        ioc.stop()
+
+if __name__ == '__main__':
+    main()
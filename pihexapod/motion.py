@@ -0,0 +1,82 @@
+# Waiting for motion to finish.
+# MotionWatcher polls ONT? from one background thread for everybody waiting on
+# the hexapod, so several waiters cost one stream of queries. The interval
+# starts short and doubles while the axes are still moving.
+#
+#   fut = h.mv('X', 1.0)        # a concurrent.futures.Future
+#   fut.result(timeout=10)      # or: await asyncio.wrap_future(fut)
+import threading
+import time
+from concurrent.futures import Future
+
+class MotionWatcher:
+    """query: returns the ONT? state as {'X': True, ...}.
+    interval: first and longest time between two ONT? queries, in seconds.
+    timeout: seconds a watch() without a timeout of its own waits, None for ever."""
+    def __init__(self, query, interval=(0.005, 0.1), timeout=60.0) -> None:
+        self.query = query
+        self.min_interval, self.max_interval = interval
+        self.timeout = timeout
+        self.polls = 0
+        # (sequence number, axes, deadline, future); a waiter is only answered by an
+        # ONT? sent after it was added, i.e. after its MOV.
+        self._waiters = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def watch(self, axes, timeout=None):
+        """Future that becomes True when all axes are on target.
+        It fails with TimeoutError after timeout seconds (default: self.timeout),
+        or with the error of the ONT? query."""
+        fut = Future()
+        fut.set_running_or_notify_cancel()
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._waiters.append((self._seq, list(axes), deadline, fut))
+            self._seq += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            # start again from the short interval.
+            self._cond.notify()
+        return fut
+
+    def _run(self):
+        interval = self.min_interval
+        while True:
+            with self._cond:
+                if len(self._waiters)==0:
+                    self._thread = None
+                    return
+                # the waiters added so far have sent their MOV before this ONT?
+                issued = self._seq
+            try:
+                state = self.query()
+                self.polls += 1
+                error = None
+            except Exception as e:
+                state = None
+                error = e
+            now = time.monotonic()
+            with self._cond:
+                waiting = []
+                for seq, axes, deadline, fut in self._waiters:
+                    if seq < issued and error is not None:
+                        fut.set_exception(error)
+                    elif seq < issued and all(state.get(ax, False) for ax in axes):
+                        fut.set_result(True)
+                    elif deadline is not None and now > deadline:
+                        fut.set_exception(TimeoutError(f"{axes} not on target."))
+                    else:
+                        waiting.append((seq, axes, deadline, fut))
+                self._waiters = waiting
+                if len(waiting)==0:
+                    continue
+                # a new waiter wakes this up early and resets the interval.
+                if self._cond.wait(interval):
+                    interval = self.min_interval
+                else:
+                    interval = min(2*interval, self.max_interval)
@@ -1,31 +1,59 @@
 #print("EPICS IOC is not running.")
 #print("Connecting with pipython.")
+import re
+import time
 from pipython import GCSDevice, gcserror
+from pipython.pidevice.interfaces.pisocket import PISocket
+from .commands import CommandPipeline
+
+# end of an answer: a linefeed that has no space before it
+_EOL = re.compile(r'(?<! )\n')
+
+class _Socket(PISocket):
+    # close() is called by Hexapod.close() and again when the GCSDevice is released.
+    def close(self):
+        if self.connected:
+            super().close()
 
 ## Exception handling....
 class WAV_Exception(Exception):
     pass
 
-class Hexapod:
+class Hexapod(CommandPipeline):
 
     def __init__(self, IP, dev='C-887') -> None:
         self.connectiontype = -1
+        self.dev = dev
+        self.gateway = None
         self.pidev = GCSDevice(dev)
         self.axes = ['X', 'Y', 'Z', 'U', 'V', 'W']
         self.ip = IP
+        self._init_pipeline()
 
     def connect(self, IP=""):
-        """connecting"""
+        """connecting
+        IP can carry a port, e.g. '127.0.0.1:50001' for the simulator."""
         notconnected = False
         if len(IP)>0:
             self.ip = IP
 
         if len(self.ip.split('.'))==4:
+            host, _, port = self.ip.partition(':')
+            port = int(port) if len(port)>0 else 50000
             try:
-                self.pidev.ConnectTCPIP(self.ip)
+                self.pidev.ConnectTCPIP(host, port)
             except gcserror.GCSError:
                 print('Connection failed. Check your IP or another software running for the IP.')
                 notconnected = True
+            except OSError:
+                # the PI GCS library is not installed, talk to the socket directly.
+                PISocket.unregister_connection_status_changed_callback(self.pidev.connection_status_changed)
+                try:
+                    self.gateway = _Socket(host, port)
+                    self.pidev = GCSDevice(self.dev, gateway=self.gateway)
+                except OSError:
+                    print('Connection failed. Check your IP or another software running for the IP.')
+                    notconnected = True
         else:
             try:
                 self.pidev.InterfaceSetupDlg()
@@ -37,21 +65,86 @@ class Hexapod:
             self.connectiontype = 1
         return self.connectiontype
 
-    def send_command(self, cmd):
-        try:
-            self.pidev.gcscommands.send(cmd)
-        except gcserror.GCSError:
-            raise gcserror.GCSError
-        
+    def _write_command(self, cmd):
+        self.pidev.gcscommands.send(cmd)
+
+    def _write_lines(self, lines):
+        # all lines in one write, each followed by ERR?, then the errors are read
+        gcs = self.pidev.gcscommands
+        if not gcs.errcheck:
+            gcs.send('\n'.join(lines))
+            return
+        if not self._can_stream():
+            for line in lines:
+                try:
+                    gcs.send(line)
+                except gcserror.GCSError as e:
+                    raise gcserror.GCSError(e.val, f"at {line!r}") from e
+            return
+        errs = self._exchange([f"{line}\nERR?" for line in lines], len(lines))
+        for line, err in zip(lines, errs):
+            if int(err):
+                raise gcserror.GCSError(int(err), f"at {line!r}")
+
+    def _can_stream(self):
+        # _exchange needs the lock GCSMessages takes around a command and its answer;
+        # it is not public, so without it the lines are sent one by one.
+        msgs = self.pidev.gcscommands.messages
+        return hasattr(msgs, '_lock') and hasattr(msgs, 'interface')
+
+    def _exchange(self, lines, n):
+        # write lines at once and read n answers
+        msgs = self.pidev.gcscommands.messages
+        interface = msgs.interface
+        answers = []
+        rcvbuf = ''
+        with msgs._lock:
+            interface.send('\n'.join(lines) + '\n')
+            timeout = time.time() + msgs.timeout/1000.
+            while len(answers) < n:
+                received = interface.read()
+                if received:
+                    rcvbuf += received
+                    timeout = time.time() + msgs.timeout/1000.
+                    start = 0
+                    for m in _EOL.finditer(rcvbuf):
+                        answers.append(rcvbuf[start:m.end()])
+                        start = m.end()
+                    rcvbuf = rcvbuf[start:]
+                elif time.time() > timeout:
+                    raise gcserror.GCSError(gcserror.E_7_COM_TIMEOUT, '@ pigcs')
+        return answers
+
     def send_read_command(self, cmd):
-        try:
-            return self.pidev.gcscommands.read(cmd)
-        except gcserror.GCSError:
-            raise gcserror.GCSError
+        self.flush()
+        return self.pidev.gcscommands.read(cmd)
+
+    def send_read_commands(self, cmds):
+        """write the queries cmds back-to-back in one write (and one ERR?),
+        then read their answers. Returns the answers in the order of cmds."""
+        self.flush()
+        if not self._can_stream():
+            return [self.pidev.gcscommands.read(cmd) for cmd in cmds]
+        errcheck = self.pidev.gcscommands.errcheck
+        cmds = list(cmds) + (['ERR?'] if errcheck else [])
+        answers = self._exchange(cmds, len(cmds))
+        if errcheck:
+            err = int(answers.pop())
+            if err:
+                raise gcserror.GCSError(err)
+        return answers
 
     def close(self):
         """disconnect"""
-        self.pidev.CloseConnection()
+        if self.gateway is not None:
+            # the socket is closed now, not when the old GCSDevice happens to be released,
+            # and the old device no longer hears of the sockets connected later.
+            PISocket.unregister_connection_status_changed_callback(self.pidev.connection_status_changed)
+            self.gateway.close()
+            self.pidev = GCSDevice(self.dev)
+            self.gateway = None
+        else:
+            self.pidev.CloseConnection()
 
     def KEN(self, CS):
         """KEN"""
@@ -82,21 +175,26 @@ class Hexapod:
         self.send_command(f"SVO X 1")
 
     def qFRF(self):
+        self.flush()
         return self.pidev.qFRF()
     
     def qSVO(self):
+        self.flush()
         return self.pidev.qSVO()
     
     def qKET(self):
         """KET?"""
+        self.flush()
         return self.pidev.qKET()
 
     def qKLT(self):
         """KLT?"""
+        self.flush()
         s = self.pidev.qKLT()
         return s
 
     def get_pos(self):
+        self.flush()
         s = None
         max_retry = 5
         i = 0
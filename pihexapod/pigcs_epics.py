@@ -1,8 +1,22 @@
 import epics as ep
 from epics import caput, caget
 import time
+import threading
+import numpy as np
+from .decode import decode_POS, decode_SVO, decode_FRF
+from .commands import coalesce, MAX_LINE_LENGTH
 mycs = "PTYCHO"
 
+def decode_binp(val):
+    """BINP bytes as a string, trimmed at the first null.
+    val is what pyepics returns: a numpy array holding NORD elements."""
+    if isinstance(val, str):
+        return val.partition('\0')[0]
+    raw = np.asarray(val)
+    if raw.dtype != np.uint8:
+        raw = raw.astype(np.uint8)
+    return raw.tobytes().partition(b'\0')[0].decode('latin-1')
+
 class Hexapod:
     """A code to control through epics"""
     def __init__(self, base) -> None:
@@ -13,17 +27,33 @@ class Hexapod:
         self.hxpout = []
         self.hxpinb = []
         self.connectiontype = -1
+        # BINP monitor: counts replies and wakes up the queries waiting for them.
+        self._reply = threading.Condition()
+        self._nreply = 0
+        self._binp = None
+        # characters of a command line that fit in AOUT with the terminator, see connect()
+        self.max_line_length = ep.dbr.MAX_STRING_SIZE - 1 - len(self._terminator)
+        # GCS commands asked for and command lines actually written
+        self.commands_sent = 0
+        self.lines_written = 0
 
     def connect(self):
         """connect"""
         self.hxpout = ep.PV(self.basepv+".AOUT")
-        time.sleep(self.waittime)
+        self.hxpout.wait_for_connection(timeout=self.waittime)
         if self.hxpout.connected:
+            # AOUT is a string field of 40 bytes; its long-string view AOUT$ may take more.
+            longout = ep.PV(self.basepv+".AOUT$")
+            if longout.wait_for_connection(timeout=self.waittime) and longout.nelm > ep.dbr.MAX_STRING_SIZE:
+                self.hxpout = longout
+            size = max(self.hxpout.nelm, ep.dbr.MAX_STRING_SIZE)
+            self.max_line_length = min(size - 1 - len(self._terminator), MAX_LINE_LENGTH)
             #self.hxpin = ep.PV(self.basepv+".AINP")
             #self.hxpoutb = ep.PV(self.basepv+".BOUT")
 #            self.hxpoutb_len = ep.PV(self.basepv+".NOWT")
 #            self.hxplenSent = ep.PV(self.basepv+".NAWT")
-            self.hxpinb = ep.PV(self.basepv+".BINP")
+            self.hxpinb = ep.PV(self.basepv+".BINP", auto_monitor=True, callback=self._on_binp)
+            self.hxpinb.wait_for_connection(timeout=self.waittime)
 
             caput(self.basepv+".OFMT", "ASCII")
             caput(self.basepv+".IFMT", "Binary")
@@ -35,26 +65,67 @@ class Hexapod:
             self.connectiontype = 0
         return self.connectiontype
 
+    def _put(self, com):
+        # write one line through AOUT, without waiting for the record to process it
+        if len(com) > self.max_line_length:
+            raise ValueError(f"{com!r} is longer than the {self.max_line_length} characters AOUT takes.")
+        self.hxpout.put(com+self._terminator)
+
     def send_command(self, com):
         """send data through AOUT"""
-        self.hxpout.put(com+self._terminator)
+        self.commands_sent += 1
+        self.lines_written += 1
+        self._put(com)
+
+    def send_commands(self, cmds):
+        """send cmds, merged into lines that fit in AOUT (see commands.coalesce)"""
+        lines = coalesce(cmds, self.max_line_length)
+        self.commands_sent += len(cmds)
+        self.lines_written += len(lines)
+        for line in lines:
+            self._put(line)
 
     def send_read_command(self, com):
         """send data through AOUT"""
-        self.send_command(self, com)
-        return self.get()
+        return self.query(com)
+
+    def _on_binp(self, value=None, **kwargs):
+        with self._reply:
+            self._binp = value
+            self._nreply += 1
+            self._reply.notify_all()
+
+    def query(self, com, marker=None, timeout=None):
+        """send com and wait for the next non-empty BINP update that contains marker.
+        raises TimeoutError when no such reply arrives within timeout (default: waittime) seconds."""
+        if timeout is None:
+            timeout = self.waittime
+        deadline = time.time() + timeout
+        with self._reply:
+            n = self._nreply
+            self._put(com)
+            while True:
+                if self._nreply != n:
+                    s = self.get_binary(self._binp)
+                    # a command put before, not waited for, may update BINP after n was taken.
+                    # Commands leave it empty and every query has an answer, so skip empty ones.
+                    if len(s) > 0 and (marker is None or marker in s):
+                        return s
+                    n = self._nreply
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"No reply to {com} from {self.basepv}.")
+                self._reply.wait(remaining)
 
     def get(self):
         """read data"""
         return self.get_binary()
 
-    def get_binary(self):
+    def get_binary(self, val=None):
         """read data from BINP"""
-        val = self.hxpinb.get()
-        v = ""
-        for b in val:
-            v = v+chr(b)
-        return v
+        if val is None:
+            val = self.hxpinb.get()
+        return decode_binp(val)
 
     def KEN(self, CS):
         """KEN"""
@@ -82,85 +153,16 @@ class Hexapod:
         self.send_command(f"FRF X")
 
     def qKET(self):
-        self.send_command("KET?")
-        strv = ""
-        st = time.time()
-        while len(strv)==0:
-            time.sleep(0.1)
-            strv = self.get()
-            if 'PI_BASE' not in strv:
-                strv = ""
-            if (time.time()-st)>self.waittime:
-                break
-        if len(strv)==0:
-            ValueError("Connecion is failed.")
-        return strv
+        return self.query("KET?", 'PI_BASE')
 
     def qFRF(self):
-        self.send_command("FRF?")
-        s = ""
-        st = time.time()
-        while len(s)==0:
-            time.sleep(0.1)
-            s = self.get()
-            if 'Name=' not in s:
-                s = ""
-            if (time.time()-st)>self.waittime:
-                break
-        if len(s)==0:
-            ValueError("Connecion is failed.")
-        return s
+        return decode_FRF(self.query("FRF?", 'W='))
     
     def qSVO(self):
-        self.send_command("SVO?")
-        s = ""
-        st = time.time()
-        while len(s)==0:
-            time.sleep(0.1)
-            s = self.get()
-            if 'Name=' not in s:
-                s = ""
-            if (time.time()-st)>self.waittime:
-                break
-        if len(s)==0:
-            ValueError("Connecion is failed.")
-        return s
+        return decode_SVO(self.query("SVO?", 'W='))
     
     def qKLT(self):
-        self.send_command("KLT?")
-        s = ""
-        st = time.time()
-        while len(s)==0:
-            time.sleep(0.1)
-            s = self.get()
-            if 'Name=' not in s:
-                s = ""
-            if (time.time()-st)>self.waittime:
-                break
-        if len(s)==0:
-            ValueError("Connecion is failed.")
-        return s
+        return self.query("KLT?", 'Name=')
     
     def get_pos(self):
-        self.send_command("POS?")
-        s = ""
-        st = time.time()
-        while len(s)==0:
-            time.sleep(0.1)
-            s = self.get()
-            if 'W=' not in s:
-                s = ""
-            if (time.time()-st)>self.waittime:
-                break
-        if len(s)==0:
-            ValueError("Connecion is failed.")
-        
-        # decode returns
-        a = s.split('\n')
-        pos = OrderedDict()
-        
-        for arg in a:
-            if len(arg)>0:
-                b = arg.split('=')
-                pos[b[0]]=float(b[1])
-        return pos
\ No newline at end of file
+        return decode_POS(self.query("POS?", 'W='))
\ No newline at end of file
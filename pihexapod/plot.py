@@ -0,0 +1,89 @@
+# Plotting the following error of long recordings.
+# A screen shows at most a few thousand points across, so every curve is cut
+# into width bins and only the min and max of each bin are drawn; peaks stay
+# visible while a 1e6 sample scan costs 2*width points. Lines are updated in
+# place, so a RecordPlot can be refreshed from a loop (e.g. over iter_records)
+# without plt.show() blocking it.
+#
+#   p = RecordPlot('XZ')
+#   for run, rec in enumerate(records):
+#       p.plot(rec, label=run)
+#   p.show()
+import numpy as np
+import matplotlib.pyplot as plt
+
+def minmax_indices(y, width):
+    """indices of the min and max of y in each of width bins, in order"""
+    n = len(y)
+    if n <= 2*width:
+        return np.arange(n)
+    k = -(-n//width)
+    rows = -(-n//k)
+    # pad with the last value so that the padding never wins over it
+    padded = np.empty(rows*k, dtype=y.dtype)
+    padded[:n] = y
+    padded[n:] = y[-1]
+    padded = padded.reshape(rows, k)
+    start = np.arange(rows)*k
+    imin = np.minimum(start + padded.argmin(axis=1), n-1)
+    imax = np.minimum(start + padded.argmax(axis=1), n-1)
+    idx = np.empty(2*rows, dtype=np.intp)
+    idx[0::2] = np.minimum(imin, imax)
+    idx[1::2] = np.maximum(imin, imax)
+    return idx
+
+def following_error(data, axis):
+    """real - target in nm of a Record or a get_records dict"""
+    if hasattr(data, 'error'):
+        return data.error(axis)*1000000
+    return (data[axis][1]-data[axis][0])*1000000
+
+class RecordPlot:
+    """one subplot per axis, one line per run, each decimated to width bins."""
+    def __init__(self, axes='X', width=2000) -> None:
+        self.axes = list(axes)
+        self.width = width
+        self.fig, subplots = plt.subplots(len(self.axes), 1, sharex=True, squeeze=False)
+        self.subplots = dict(zip(self.axes, subplots[:, 0]))
+        self.lines = {}     # (label, axis) -> Line2D
+        for ax in self.axes:
+            self.subplots[ax].set_ylabel(f'{ax}: Real - Target (nm)')
+
+    def plot(self, data, label=None, append=False):
+        """draw data (a Record or a get_records dict) as the run label.
+        A label already drawn is replaced, or extended with append (e.g. iter_records blocks)."""
+        if label is None:
+            label = len(self.lines)//len(self.axes)
+        offset = data['Offset'] if 'Offset' in data else 0
+        for ax in self.axes:
+            err = following_error(data, ax)
+            idx = minmax_indices(err, self.width)
+            x = idx + offset
+            y = err[idx]
+            line = self.lines.get((label, ax))
+            if line is None:
+                line, = self.subplots[ax].plot(x, y, label=str(label))
+                self.lines[(label, ax)] = line
+                continue
+            if append:
+                x = np.concatenate((line.get_xdata(), x))
+                y = np.concatenate((line.get_ydata(), y))
+                # min/max of the bins' min/max is still the envelope
+                idx = minmax_indices(y, self.width)
+                x, y = x[idx], y[idx]
+            line.set_data(x, y)
+        if 'Sample Time' in data:
+            self.subplots[self.axes[-1]].set_xlabel(f"Time (/{data['Sample Time']} s)")
+        self.refresh()
+        return self
+
+    def refresh(self):
+        """rescale and let the GUI redraw when it gets to it"""
+        for sub in self.subplots.values():
+            sub.relim()
+            sub.autoscale_view()
+        self.fig.canvas.draw_idle()
+        self.fig.canvas.flush_events()
+
+    def show(self, block=False):
+        plt.show(block=block)
@@ -0,0 +1,91 @@
+# Data recorder readout as one array.
+# Record keeps the recorded tables in a single (samples, tables) array, which
+# may also be a memory map, and hands out per-axis views of it. Derived values
+# such as the following error are computed when asked for, not stored.
+#
+#   rec = h.get_records()
+#   rec.real('X'), rec.error('X'), rec.time
+#   rec['X']        # (target, real), as the dict get_records used to return
+from collections.abc import Mapping
+import numpy as np
+from .decode import RECORD_CHANNELS, decode_DRR_table
+
+class Record(Mapping):
+    """data: (samples, tables) array; channels: (axis, DRC option) of each column,
+    option 1 target and 2 real position. sample_time in seconds.
+    offset: index of the first sample in the whole recording (iter_records)."""
+    def __init__(self, data, channels=None, sample_time=None, offset=0) -> None:
+        self.data = data
+        self.channels = list(RECORD_CHANNELS if channels is None else channels)[:data.shape[1]]
+        self.sample_time = sample_time
+        self.offset = offset
+
+    @classmethod
+    def from_DRR(cls, s, channels=None, offset=0):
+        """from a DRR? reply"""
+        sample_time, table = decode_DRR_table(s)
+        return cls(table, channels, sample_time, offset)
+
+    @property
+    def axes(self):
+        axes = []
+        for ax, _ in self.channels:
+            if ax not in axes:
+                axes.append(ax)
+        return axes
+
+    @property
+    def samples(self):
+        return self.data.shape[0]
+
+    def column(self, axis, option):
+        """view of the column recording axis with the DRC option, None if not recorded"""
+        for i, ch in enumerate(self.channels):
+            if ch == (axis, option):
+                return self.data[:, i]
+        return None
+
+    def target(self, axis):
+        return self.column(axis, 1)
+
+    def real(self, axis):
+        return self.column(axis, 2)
+
+    def error(self, axis):
+        """following error, real - target (a new array)"""
+        target = self.target(axis)
+        real = self.real(axis)
+        if target is None or real is None:
+            raise KeyError(f"{axis} needs both target and real positions recorded.")
+        return real - target
+
+    @property
+    def time(self):
+        """time of each sample from the start of the recording"""
+        dt = 1.0 if self.sample_time is None else self.sample_time
+        return (self.offset + np.arange(self.samples))*dt
+
+    # the keys of the dict that get_records used to return
+    def __getitem__(self, key):
+        if key == 'Sample Time' and self.sample_time is not None:
+            return self.sample_time
+        if key == 'Data':
+            return self.data
+        if key == 'Offset':
+            return self.offset
+        if key in self.axes:
+            return (self.target(key), self.real(key))
+        raise KeyError(key)
+
+    def __iter__(self):
+        if self.sample_time is not None:
+            yield 'Sample Time'
+        yield from self.axes
+        yield 'Data'
+        yield 'Offset'
+
+    def __len__(self):
+        return len(self.axes) + (3 if self.sample_time is not None else 2)
+
+    def __repr__(self):
+        return f"Record({self.samples} samples of {self.axes}, sample time {self.sample_time})"
@@ -0,0 +1,113 @@
+# Background sampling of POS? (and ONT?) into a ring buffer.
+# One thread queries the controller at a fixed rate; readers take the latest
+# sample or the recent history from the buffer without talking to the
+# controller and without a lock.
+#
+#   s = h.start_sampler(rate=50)
+#   t, pos = s.latest()               # pos: {'X': .., ...}
+#   t, pos, ont = s.history(seconds=2)  # arrays, oldest first
+import threading
+import time
+import numpy as np
+
+class PositionSampler:
+    """get_pos: returns {'X': .., 'Y': .., ...} (POS?).
+    get_ont: optional, returns {'X': True, ...} (ONT?), sampled with every position.
+    rate: samples per second. size: samples kept."""
+    def __init__(self, get_pos, get_ont=None, rate=20.0, size=10000,
+                 axes=('X', 'Y', 'Z', 'U', 'V', 'W')) -> None:
+        self.get_pos = get_pos
+        self.get_ont = get_ont
+        self.rate = rate
+        self.axes = list(axes)
+        self.size = size
+        self.time = np.zeros(size)
+        self.pos = np.zeros((size, len(self.axes)))
+        self.ont = np.zeros((size, len(self.axes)), dtype=bool)
+        # number of samples ever written; sample n is in row n % size.
+        self.count = 0
+        self.errors = 0
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self):
+        period = 1.0/self.rate
+        next_t = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                pos = self.get_pos()
+                ont = self.get_ont() if self.get_ont is not None else None
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+            else:
+                row = self.count % self.size
+                self.time[row] = time.time()
+                self.pos[row] = [pos[ax] for ax in self.axes]
+                if ont is not None:
+                    self.ont[row] = [ont[ax] for ax in self.axes]
+                # publish the row only after it is complete.
+                self.count += 1
+            next_t += period
+            delay = next_t - time.monotonic()
+            if delay < 0:
+                # the controller is slower than rate, do not try to catch up.
+                next_t = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+
+    def latest(self):
+        """(time, {'X': ..}) of the newest sample, (None, None) before the first one"""
+        n = self.count
+        if n == 0:
+            return None, None
+        row = (n-1) % self.size
+        return float(self.time[row]), dict(zip(self.axes, self.pos[row].tolist()))
+
+    def history(self, n=None, seconds=None):
+        """the last n samples, or those of the last seconds, oldest first,
+        as copies (time, pos, ont) with pos and ont of shape (samples, axes)."""
+        while True:
+            count = self.count
+            available = min(count, self.size - 1)
+            if n is None:
+                k = available
+            else:
+                k = min(n, available)
+            rows = np.arange(count - k, count) % self.size
+            t = self.time[rows]
+            pos = self.pos[rows]
+            ont = self.ont[rows]
+            # the writer may have wrapped over the rows while they were copied.
+            if self.count - count < self.size - k:
+                break
+        if seconds is not None:
+            keep = t >= t[-1] - seconds if len(t) > 0 else slice(None)
+            t, pos, ont = t[keep], pos[keep], ont[keep]
+        return t, pos, ont
@@ -0,0 +1,572 @@
+# A local stand-in for the C-887 hexapod controller.
+# It listens on a TCP port and answers the GCS commands that pihexapod uses,
+# so that the package can be exercised and benchmarked without the hardware.
+#
+#   python -m pihexapod.simulator --port 50000 --latency 0.001
+#
+# or from python
+#   from pihexapod.simulator import Simulator
+#   with Simulator(port=0) as sim:
+#       h = Hexapod(f"127.0.0.1:{sim.port}")
+import argparse
+import queue
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from .wavemodel import wave_segment
+
+AXES = ['X', 'Y', 'Z', 'U', 'V', 'W']
+# GCS2 error codes used by the simulator.
+E_NO_ERROR = 0
+E_PARAM_SYNTAX = 1
+E_UNKNOWN_COMMAND = 2
+E_INVALID_AXIS = 15
+E_PARAM_OUT_OF_RANGE = 17
+E_WAVE_TOO_LONG = 67
+E_UNKNOWN_CS = 530
+E_CS_IN_USE = 532
+
+def _lines(items):
+    """join reply lines with the GCS continuation ' \\n'"""
+    return ' \n'.join(items) + '\n'
+
+class GCSCommandError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+class SimulatedController:
+    """State of a simulated C-887 and the GCS command interpreter for it.
+    latency: delay in seconds before each answer reaches the client. Like a network round trip,
+        it does not hold up the commands that follow.
+    command_time: delay in seconds for each command without an answer.
+    velocity: default VLS value in mm/s.
+    time_scale: >1 makes motion and wave generator output run faster than real time.
+    """
+    sample_time = 0.001
+    max_wave_points = 262144
+    max_record_points = 262144
+    number_of_wave_tables = 16
+    number_of_record_tables = 16
+
+    def __init__(self, latency=0.0, command_time=0.0, velocity=10.0, time_scale=1.0, noise=5e-6):
+        self.latency = latency
+        self.command_time = command_time
+        self.time_scale = time_scale
+        self.noise = noise
+        self.lock = threading.RLock()
+        self.error = E_NO_ERROR
+        self.velocity = velocity
+        self.servo = {ax: True for ax in AXES}
+        self.referenced = {ax: True for ax in AXES}
+        self.position = {ax: 0.0 for ax in AXES}
+        self.target = {ax: 0.0 for ax in AXES}
+        self.motion = {}
+        self.cs = OrderedDict()
+        self.cs['ZERO'] = {'parent': 'ZERO', **{ax: 0.0 for ax in AXES}}
+        self.active_cs = 'ZERO'
+        self.wave_tables = {}
+        self.wave_selection = {}
+        self.wave_cycles = {}
+        self.wave_running = {}
+        self.triggers = {}
+        self.trigger_output = {}
+        self.record_config = OrderedDict((i, ('0', 0)) for i in range(1, self.number_of_record_tables + 1))
+        self.record_rate = 1
+        self.record_start = None
+        self.record_snapshot = {}
+        self.record_static = dict(self.position)
+        self.commands = 0
+        self.queries = 0
+        self.verbs = {
+            'ERR?': self.qERR, '*IDN?': self.qIDN, 'CSV?': self.qCSV,
+            'KLT?': self.qKLT, 'KET?': self.qKET, 'KSD': self.KSD, 'KLN': self.KLN,
+            'KEN': self.KEN, 'KRM': self.KRM,
+            'POS?': self.qPOS, 'ONT?': self.qONT, 'SVO?': self.qSVO, 'SVO': self.SVO,
+            'FRF?': self.qFRF, 'FRF': self.FRF, 'MOV': self.MOV, 'MOV?': self.qMOV,
+            'VLS': self.VLS, 'VLS?': self.qVLS, 'HLT': self.HLT, 'STP': self.HLT,
+            'WAV': self.WAV, 'WAV?': self.qWAV, 'WSL': self.WSL, 'WSL?': self.qWSL, 'WGC': self.WGC,
+            'WGO': self.WGO, 'WMS?': self.qWMS, 'GWD?': self.qGWD, 'TWG?': self.qTWG,
+            'TWS': self.TWS, 'TWC': self.TWC, 'CTO': self.CTO, 'CTO?': self.qCTO,
+            'DRC': self.DRC, 'DRC?': self.qDRC, 'DRR?': self.qDRR, 'DRL?': self.qDRL,
+            'RTR': self.RTR, 'RTR?': self.qRTR,
+        }
+
+    # -- interpreter
+    def execute(self, line):
+        """run one command line, return the answer or None"""
+        fields = line.split()
+        if len(fields) == 0:
+            return None
+        verb = fields[0].upper()
+        is_query = verb.endswith('?')
+        with self.lock:
+            if is_query:
+                self.queries += 1
+            else:
+                self.commands += 1
+            func = self.verbs.get(verb)
+            if func is None:
+                self._set_error(E_UNKNOWN_COMMAND)
+                return None
+            try:
+                answer = func(*fields[1:])
+            except GCSCommandError as e:
+                self._set_error(e.code)
+                answer = None
+            except (ValueError, IndexError, KeyError):
+                self._set_error(E_PARAM_SYNTAX)
+                answer = None
+        if is_query:
+            if answer is None:
+                answer = '\n'
+        elif self.command_time > 0:
+            time.sleep(self.command_time)
+        return answer
+
+    def _set_error(self, code):
+        # like the controller, keep the first error until it is read with ERR?
+        if self.error == E_NO_ERROR:
+            self.error = code
+
+    def _now(self):
+        return time.perf_counter()*self.time_scale
+
+    @staticmethod
+    def _pairs(args):
+        if len(args) % 2:
+            raise GCSCommandError(E_PARAM_SYNTAX)
+        return list(zip(args[0::2], args[1::2]))
+
+    @staticmethod
+    def _axis(name):
+        name = name.upper()
+        if name not in AXES:
+            raise GCSCommandError(E_INVALID_AXIS)
+        return name
+
+    def _selected_axes(self, args):
+        if len(args) == 0:
+            return AXES
+        return [self._axis(a) for a in args]
+
+    # -- general
+    def qERR(self):
+        err = self.error
+        self.error = E_NO_ERROR
+        return f"{err}\n"
+
+    def qIDN(self):
+        return "(c)2023 Physik Instrumente (PI) GmbH & Co. KG, C-887, 0, 2.5.1.46 (simulated)\n"
+
+    def qCSV(self):
+        return "2.0\n"
+
+    # -- coordinate systems
+    def qKLT(self, *args):
+        out = []
+        for name, cs in self.cs.items():
+            fields = [f"Name={name}", f"EndCoordinateSystem={cs['parent']}"]
+            fields += [f"{ax}={cs[ax]:.6f}" for ax in AXES]
+            out.append('\t'.join(fields))
+        return _lines(out)
+
+    def qKET(self, *args):
+        out = []
+        if self.active_cs != 'ZERO':
+            out.append(f"KSD={self.active_cs}")
+        out.append("PI_BASE=PI_BASE")
+        return _lines(out)
+
+    def KSD(self, name, *args):
+        name = name.upper()
+        if name == 'ZERO':
+            raise GCSCommandError(E_PARAM_SYNTAX)
+        if name == self.active_cs:
+            raise GCSCommandError(E_CS_IN_USE)
+        values = [(self._axis(ax), float(v)) for ax, v in self._pairs(args)]
+        if name not in self.cs:
+            self.cs[name] = {'parent': 'ZERO', **{ax: 0.0 for ax in AXES}}
+        for ax, v in values:
+            self.cs[name][ax] = v
+
+    def KLN(self, child, parent):
+        child = child.upper()
+        parent = parent.upper()
+        if child not in self.cs or parent not in self.cs:
+            raise GCSCommandError(E_UNKNOWN_CS)
+        self.cs[child]['parent'] = parent
+
+    def KEN(self, name):
+        name = name.upper()
+        if name not in self.cs:
+            raise GCSCommandError(E_UNKNOWN_CS)
+        self.active_cs = name
+
+    def KRM(self, name):
+        name = name.upper()
+        if name == 'ZERO' or name not in self.cs:
+            raise GCSCommandError(E_UNKNOWN_CS)
+        if name == self.active_cs:
+            raise GCSCommandError(E_CS_IN_USE)
+        del self.cs[name]
+
+    # -- motion
+    def _update(self, now=None):
+        """bring positions up to date with MOV motion and the wave generators"""
+        if now is None:
+            now = self._now()
+        for ax, (p0, p1, t0, duration) in list(self.motion.items()):
+            if now - t0 >= duration:
+                self.position[ax] = p1
+                del self.motion[ax]
+            else:
+                self.position[ax] = p0 + (p1 - p0)*(now - t0)/duration
+        for gen, t0 in list(self.wave_running.items()):
+            ax = AXES[gen - 1]
+            wave = self.wave_tables.get(self.wave_selection.get(gen, 0))
+            if wave is None or len(wave) == 0:
+                del self.wave_running[gen]
+                continue
+            index = int((now - t0)/self.sample_time)
+            cycles = self.wave_cycles.get(gen, 1)
+            if cycles > 0 and index >= len(wave)*cycles:
+                self.position[ax] = float(wave[-1])
+                del self.wave_running[gen]
+            else:
+                self.position[ax] = float(wave[index % len(wave)])
+            self.target[ax] = self.position[ax]
+
+    def qPOS(self, *args):
+        self._update()
+        return _lines([f"{ax}={self.position[ax]:.6f}" for ax in self._selected_axes(args)])
+
+    def qMOV(self, *args):
+        return _lines([f"{ax}={self.target[ax]:.6f}" for ax in self._selected_axes(args)])
+
+    def qONT(self, *args):
+        self._update()
+        moving = set(self.motion) | {AXES[gen - 1] for gen in self.wave_running}
+        return _lines([f"{ax}={int(ax not in moving)}" for ax in self._selected_axes(args)])
+
+    def qSVO(self, *args):
+        return _lines([f"{ax}={int(self.servo[ax])}" for ax in self._selected_axes(args)])
+
+    def SVO(self, *args):
+        for ax, v in self._pairs(args):
+            self.servo[self._axis(ax)] = bool(int(v))
+
+    def qFRF(self, *args):
+        return _lines([f"{ax}={int(self.referenced[ax])}" for ax in self._selected_axes(args)])
+
+    def FRF(self, *args):
+        for ax in self._selected_axes(args):
+            self.referenced[ax] = True
+
+    def MOV(self, *args):
+        self._update()
+        now = self._now()
+        for ax, v in self._pairs(args):
+            ax = self._axis(ax)
+            value = float(v)
+            start = self.position[ax]
+            self.target[ax] = value
+            duration = abs(value - start)/self.velocity if self.velocity > 0 else 0
+            if duration > 0:
+                self.motion[ax] = (start, value, now, duration)
+
+    def HLT(self, *args):
+        self._update()
+        for ax in self._selected_axes(args):
+            self.motion.pop(ax, None)
+            self.target[ax] = self.position[ax]
+
+    def VLS(self, value):
+        self.velocity = float(value)
+
+    def qVLS(self):
+        return f"{self.velocity:.6f}\n"
+
+    # -- wave generator
+    def WAV(self, table, append, curve, *params):
+        table = int(table)
+        if table < 1 or table > self.number_of_wave_tables:
+            raise GCSCommandError(E_PARAM_OUT_OF_RANGE)
+        if curve.upper() == 'PNT':
+            # PNT startpoint n v1 .. vn
+            if len(params) < 2 or len(params) != 2 + int(params[1]):
+                raise GCSCommandError(E_PARAM_SYNTAX)
+            values = np.array([float(p) for p in params[2:]])
+        else:
+            values = wave_segment(curve.upper(), *[float(p) for p in params])
+        if append == '&' and table in self.wave_tables:
+            values = np.concatenate((self.wave_tables[table], values))
+        elif append not in ('X', '&'):
+            raise GCSCommandError(E_PARAM_SYNTAX)
+        if len(values) > self.max_wave_points:
+            raise GCSCommandError(E_WAVE_TOO_LONG)
+        self.wave_tables[table] = values
+
+    def qWAV(self, *args):
+        tables = range(1, self.number_of_wave_tables + 1)
+        if len(args) > 0:
+            tables = [int(t) for t in args[0::2]]
+        return _lines([f"{t} 1={len(self.wave_tables.get(t, []))}" for t in tables])
+
+    def qWMS(self, *args):
+        tables = range(1, self.number_of_wave_tables + 1)
+        if len(args) > 0:
+            tables = [int(t) for t in args]
+        return _lines([f"{t}={self.max_wave_points}" for t in tables])
+
+    def WSL(self, *args):
+        for gen, table in self._pairs(args):
+            self.wave_selection[int(gen)] = int(table)
+
+    def qWSL(self, *args):
+        gens = [int(g) for g in args] if len(args) > 0 else range(1, len(AXES) + 1)
+        return _lines([f"{g}={self.wave_selection.get(g, 0)}" for g in gens])
+
+    def WGC(self, *args):
+        for gen, cycles in self._pairs(args):
+            self.wave_cycles[int(gen)] = int(cycles)
+
+    def WGO(self, *args):
+        self._update()
+        now = self._now()
+        started = False
+        for gen, mode in self._pairs(args):
+            gen = int(gen)
+            if gen < 1 or gen > len(AXES):
+                raise GCSCommandError(E_PARAM_SYNTAX)
+            if int(mode) == 0:
+                self.wave_running.pop(gen, None)
+            else:
+                self.motion.pop(AXES[gen - 1], None)
+                self.wave_running[gen] = now
+                started = True
+        if started:
+            self.record_start = now
+            self.record_snapshot = {AXES[gen - 1]: (self.wave_tables.get(self.wave_selection.get(gen, 0)),
+                                                    self.wave_cycles.get(gen, 1))
+                                    for gen in self.wave_running}
+            self.record_static = dict(self.position)
+
+    def qGWD(self, start, number, *tables):
+        start = int(start)
+        number = int(number)
+        tables = [int(t) for t in tables]
+        columns = []
+        for t in tables:
+            wave = self.wave_tables.get(t, np.zeros(0))
+            columns.append(wave[start - 1:start - 1 + number])
+        n = min(len(c) for c in columns) if columns else 0
+        header = self._data_header(len(tables), n, [f"Wave table {t}" for t in tables])
+        data = np.stack([c[:n] for c in columns], axis=1) if n > 0 else np.zeros((0, len(tables)))
+        return self._data_reply(header, data)
+
+    def qTWG(self):
+        return f"{len(AXES)}\n"
+
+    def TWS(self, *args):
+        if len(args) % 3:
+            raise GCSCommandError(E_PARAM_SYNTAX)
+        for ch, point, switch in zip(args[0::3], args[1::3], args[2::3]):
+            self.triggers.setdefault(int(ch), []).append((int(float(point)), int(switch)))
+
+    def TWC(self):
+        self.triggers = {}
+
+    def CTO(self, *args):
+        if len(args) % 3:
+            raise GCSCommandError(E_PARAM_SYNTAX)
+        for ch, param, value in zip(args[0::3], args[1::3], args[2::3]):
+            self.trigger_output[(int(ch), int(param))] = value
+
+    def qCTO(self, *args):
+        return _lines([f"{ch} {param}={value}" for (ch, param), value in sorted(self.trigger_output.items())])
+
+    # -- data recorder
+    def DRC(self, *args):
+        if len(args) % 3:
+            raise GCSCommandError(E_PARAM_SYNTAX)
+        for table, source, option in zip(args[0::3], args[1::3], args[2::3]):
+            table = int(table)
+            if table not in self.record_config:
+                raise GCSCommandError(E_PARAM_SYNTAX)
+            self.record_config[table] = (source.upper(), int(option))
+
+    def qDRC(self, *args):
+        tables = self.record_config.keys()
+        if len(args) > 0:
+            tables = [int(t) for t in args]
+        return _lines([f"{t}={self.record_config[t][0]} {self.record_config[t][1]}" for t in tables])
+
+    def RTR(self, rate):
+        rate = int(rate)
+        if rate < 1:
+            raise GCSCommandError(E_PARAM_OUT_OF_RANGE)
+        self.record_rate = rate
+
+    def qRTR(self):
+        return f"{self.record_rate}\n"
+
+    def recorded_length(self):
+        if self.record_start is None:
+            return 0
+        # one point every record_rate servo cycles
+        n = int((self._now() - self.record_start)/self.sample_time)//self.record_rate
+        longest = 0
+        for wave, cycles in self.record_snapshot.values():
+            if wave is not None:
+                longest = max(longest, -(-len(wave)*max(cycles, 1)//self.record_rate))
+        return min(n, longest, self.max_record_points)
+
+    def qDRL(self, *tables):
+        if len(tables) == 0:
+            tables = list(self.record_config.keys())
+        n = self.recorded_length()
+        return _lines([f"{int(t)}={n}" for t in tables])
+
+    def _recorded_column(self, table, n):
+        source, option = self.record_config[table]
+        if source not in AXES or option not in (1, 2):
+            return np.zeros(n)
+        wave, cycles = self.record_snapshot.get(source, (None, 1))
+        if wave is None or len(wave) == 0:
+            target = np.full(n, self.record_static[source])
+        else:
+            target = wave[(np.arange(n)*self.record_rate) % len(wave)]
+        if option == 1:
+            return target
+        # the real position follows the target one servo cycle later with some noise.
+        rng = np.random.default_rng(table)
+        if wave is None or len(wave) == 0:
+            real = target
+        else:
+            real = wave[(np.arange(n)*self.record_rate - 1).clip(0) % len(wave)]
+        return real + rng.normal(0, self.noise, n)
+
+    def qDRR(self, start=1, number=0, *tables):
+        start = int(start)
+        number = int(number)
+        if len(tables) == 0:
+            tables = list(self.record_config.keys())
+        tables = [int(t) for t in tables]
+        n = self.recorded_length()
+        stop = n if number <= 0 else min(n, start - 1 + number)
+        count = max(stop - (start - 1), 0)
+        columns = [self._recorded_column(t, stop)[start - 1:] for t in tables]
+        data = np.stack(columns, axis=1) if count > 0 else np.zeros((0, len(tables)))
+        names = [f"{self.record_config[t][0]} {self.record_config[t][1]}" for t in tables]
+        header = self._data_header(len(tables), count, names, self.sample_time*self.record_rate)
+        return self._data_reply(header, data)
+
+    def _data_header(self, dim, ndata, names, sample_time=None):
+        if sample_time is None:
+            sample_time = self.sample_time
+        header = ["# TYPE = 1", "# SEPARATOR = 32", f"# DIM = {dim}",
+                  f"# SAMPLE_TIME = {sample_time:.6f}", f"# NDATA = {ndata}"]
+        header += [f"# NAME{i} = {name}" for i, name in enumerate(names)]
+        header.append("# END_HEADER")
+        return header
+
+    @staticmethod
+    def _data_reply(header, data):
+        rows = [' '.join(f"{v:.6f}" for v in row) for row in data]
+        return _lines(header + rows)
+
+class _Handler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        controller = self.server.controller
+        answers = queue.Queue()
+        sender = threading.Thread(target=self._send, args=(answers,), daemon=True)
+        sender.start()
+        for raw in self.rfile:
+            received = time.perf_counter()
+            try:
+                line = raw.decode('cp1252').strip()
+            except UnicodeDecodeError:
+                continue
+            answer = controller.execute(line)
+            if answer is not None:
+                answers.put((received + controller.latency, answer))
+        answers.put(None)
+        sender.join()
+
+    def _send(self, answers):
+        """write each answer when its latency has passed"""
+        while True:
+            item = answers.get()
+            if item is None:
+                return
+            due, answer = item
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.wfile.write(answer.encode('cp1252'))
+            except OSError:
+                return
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class Simulator:
+    """A TCP server that serves a SimulatedController.
+    port=0 picks a free port, which is then available as .port"""
+    def __init__(self, host='127.0.0.1', port=50000, **kwargs):
+        self.controller = SimulatedController(**kwargs)
+        self.server = _Server((host, port), _Handler)
+        self.server.controller = self.controller
+        self.host, self.port = self.server.server_address[:2]
+        self.thread = None
+
+    @property
+    def address(self):
+        return f"{self.host}:{self.port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated C-887 hexapod controller")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=50000)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before each query is answered")
+    parser.add_argument('--command-time', type=float, default=0.0, help="seconds for each command")
+    parser.add_argument('--velocity', type=float, default=10.0, help="default VLS in mm/s")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="speed up motion and wave output")
+    args = parser.parse_args()
+    sim = Simulator(args.host, args.port, latency=args.latency, command_time=args.command_time,
+                    velocity=args.velocity, time_scale=args.time_scale)
+    print(f"Simulated C-887 is listening on {sim.address}.")
+    try:
+        sim.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.server.server_close()
+
+if __name__ == '__main__':
+    main()
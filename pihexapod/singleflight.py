@@ -0,0 +1,61 @@
+# Sharing one controller query among concurrent callers.
+# While a query is in flight, other threads asking the same thing wait for its
+# reply instead of sending their own. With a ttl, a reply is also handed out
+# for ttl seconds after the query was sent.
+import copy
+import threading
+import time
+from concurrent.futures import Future
+
+class SingleFlight:
+    """do(key, func) runs func() once for all callers of the same key at the same time.
+    Each caller gets its own shallow copy of the result."""
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls = {}    # key -> Future of the query in flight
+        self._cache = {}    # key -> (time the query was sent, result)
+        self.queries = 0    # func() calls
+        self.shared = 0     # answers taken from another call or the cache
+
+    def do(self, key, func, ttl=0):
+        t0 = time.monotonic()
+        with self._lock:
+            if ttl > 0 and key in self._cache:
+                t, result = self._cache[key]
+                if t0 - t < ttl:
+                    self.shared += 1
+                    return copy.copy(result)
+            fut = self._calls.get(key)
+            owner = fut is None
+            if owner:
+                fut = Future()
+                self._calls[key] = fut
+                self.queries += 1
+            else:
+                self.shared += 1
+        if not owner:
+            return copy.copy(fut.result())
+        try:
+            result = func()
+        except BaseException as e:
+            with self._lock:
+                if self._calls.get(key) is fut:
+                    del self._calls[key]
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            if self._calls.get(key) is fut:
+                del self._calls[key]
+                self._cache[key] = (t0, result)
+        fut.set_result(result)
+        return copy.copy(result)
+
+    def forget(self, *keys):
+        """drop cached replies and let new callers send a new query, e.g. after a MOV.
+        Without keys, all of them."""
+        with self._lock:
+            if len(keys)==0:
+                keys = list(self._calls) + list(self._cache)
+            for key in keys:
+                self._calls.pop(key, None)
+                self._cache.pop(key, None)
@@ -0,0 +1,37 @@
+# A snapshot of the controller state, as Hexapod.status() returns it.
+from dataclasses import dataclass
+from types import MappingProxyType
+from .decode import decode_FRF, decode_SVO, decode_KET, decode_POS, decode_ONT
+
+# the queries of a snapshot, in the order they are sent
+STATUS_QUERIES = ('FRF?', 'SVO?', 'KET?', 'POS?', 'ONT?')
+
+@dataclass(frozen=True)
+class Status:
+    """time: time.time() when the queries were sent.
+    referenced (FRF?), servo (SVO?), pos (POS?) and ontarget (ONT?) are read-only {'X': ..} maps,
+    cs is the activated coordinate system (KET?), 'ZERO' when none is."""
+    time: float
+    referenced: MappingProxyType
+    servo: MappingProxyType
+    cs: str
+    pos: MappingProxyType
+    ontarget: MappingProxyType
+
+    @property
+    def ready(self):
+        """referenced, servo on and on target on all axes"""
+        return (all(self.referenced.values()) and all(self.servo.values())
+                and all(self.ontarget.values()))
+
+    @classmethod
+    def from_replies(cls, t, replies):
+        """replies: the answers to STATUS_QUERIES"""
+        frf, svo, ket, pos, ont = replies
+        cs = decode_KET(ket)
+        return cls(t,
+                   MappingProxyType(dict(decode_FRF(frf))),
+                   MappingProxyType(dict(decode_SVO(svo))),
+                   'ZERO' if cs is None else cs,
+                   MappingProxyType(dict(decode_POS(pos))),
+                   MappingProxyType(decode_ONT(ont)))
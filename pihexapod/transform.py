@@ -0,0 +1,90 @@
+# Conversion of hexapod poses between coordinate systems on the host.
+# A pose is (X, Y, Z, U, V, W) in mm and degrees. As on the C-887, U, V and W
+# rotate about the fixed X, Y and Z axes in that order, so the pose is the
+# transform  T = Trans(X, Y, Z) Rz(W) Ry(V) Rx(U).
+# A KSD coordinate system is such a pose relative to its parent (KLN), and a
+# pose given in it is the same pose in the parent after applying the KSD pose.
+#
+#   tree = CSTree(decode_KLT(h.pidev.qKLT()))
+#   zero = tree.convert(poses, 'PTYCHO', 'ZERO')   # poses: (N, 6) array
+import numpy as np
+
+def pose_matrix(poses):
+    """(..., 6) poses -> (..., 3, 3) rotations and (..., 3) translations"""
+    p = np.asarray(poses, dtype=float)
+    u, v, w = np.deg2rad(p[..., 3]), np.deg2rad(p[..., 4]), np.deg2rad(p[..., 5])
+    cu, su = np.cos(u), np.sin(u)
+    cv, sv = np.cos(v), np.sin(v)
+    cw, sw = np.cos(w), np.sin(w)
+    R = np.empty(p.shape[:-1] + (3, 3))
+    R[..., 0, 0] = cw*cv
+    R[..., 0, 1] = cw*sv*su - sw*cu
+    R[..., 0, 2] = cw*sv*cu + sw*su
+    R[..., 1, 0] = sw*cv
+    R[..., 1, 1] = sw*sv*su + cw*cu
+    R[..., 1, 2] = sw*sv*cu - cw*su
+    R[..., 2, 0] = -sv
+    R[..., 2, 1] = cv*su
+    R[..., 2, 2] = cv*cu
+    return R, p[..., :3].copy()
+
+def matrix_pose(R, t):
+    """inverse of pose_matrix"""
+    out = np.empty(np.shape(t)[:-1] + (6,))
+    out[..., :3] = t
+    out[..., 3] = np.rad2deg(np.arctan2(R[..., 2, 1], R[..., 2, 2]))
+    out[..., 4] = np.rad2deg(np.arctan2(-R[..., 2, 0], np.hypot(R[..., 0, 0], R[..., 1, 0])))
+    out[..., 5] = np.rad2deg(np.arctan2(R[..., 1, 0], R[..., 0, 0]))
+    return out
+
+class CSTree:
+    """The KSD coordinate systems of a KLT? reply, as decode_KLT returns it.
+    Systems whose parent is not listed (ZERO, PI_BASE, ...) are taken as ZERO."""
+    def __init__(self, cslist, axes=('X', 'Y', 'Z', 'U', 'V', 'W')) -> None:
+        self.parent = {}
+        self.pose = {}
+        for cs in cslist:
+            if 'Name' not in cs:
+                continue
+            name = cs['Name']
+            self.parent[name] = cs.get('EndCoordinateSystem', 'ZERO')
+            self.pose[name] = [float(cs.get(ax, 0.0)) for ax in axes]
+        self._chain = {}
+
+    def to_zero(self, name):
+        """(R, t) of name in ZERO, i.e. the KSD poses from name up to the root composed"""
+        if name in self._chain:
+            return self._chain[name]
+        R = np.eye(3)
+        t = np.zeros(3)
+        cs = name
+        seen = set()
+        while cs in self.pose and cs != 'ZERO':
+            if cs in seen:
+                raise ValueError(f"Coordinate systems linked in a loop at {cs}.")
+            seen.add(cs)
+            Rp, tp = pose_matrix(self.pose[cs])
+            R, t = Rp @ R, Rp @ t + tp
+            cs = self.parent[cs]
+        if name != 'ZERO' and name not in self.pose:
+            raise KeyError(f"No coordinate system {name}.")
+        self._chain[name] = (R, t)
+        return R, t
+
+    def convert(self, poses, src, dst='ZERO'):
+        """poses (..., 6) given in src -> the same poses in dst"""
+        Rs, ts = self.to_zero(src)
+        Rd, td = self.to_zero(dst)
+        # dst <- ZERO <- src as one transform
+        Rm = Rd.T @ Rs
+        tm = Rd.T @ (ts - td)
+        R, t = pose_matrix(poses)
+        return matrix_pose(Rm @ R, t @ Rm.T + tm)
+
+    def convert_points(self, xyz, src, dst='ZERO'):
+        """positions only: xyz (..., 3) in src -> dst"""
+        Rs, ts = self.to_zero(src)
+        Rd, td = self.to_zero(dst)
+        Rm = Rd.T @ Rs
+        tm = Rd.T @ (ts - td)
+        return np.asarray(xyz, dtype=float) @ Rm.T + tm
@@ -0,0 +1,91 @@
+# Which wave table holds which trajectory.
+# A trajectory is known by its WAV program without the table ID, so the same
+# scan finds its table again wherever it was put. When no table is free (or,
+# with a capacity, the tables would hold more points than that together), the
+# trajectories used least recently are given up first; they are uploaded again
+# if asked for.
+#
+#   table, evicted = alloc.allocate(trajectory_key(cmds), points, prefer=13)
+#   cmds = retarget(cmds, table)
+from collections import OrderedDict
+from .wavecache import program_key
+
+def _body(cmd):
+    # 'WAV id X LIN ..' -> 'X LIN ..'
+    return cmd.split(None, 2)[2]
+
+def trajectory_key(cmds):
+    """hash of WAV commands, whatever table they are for"""
+    return program_key([_body(cmd) for cmd in cmds])
+
+def retarget(cmds, table):
+    """the WAV commands cmds for table"""
+    return [f"WAV {table} {_body(cmd)}" for cmd in cmds]
+
+class WaveAllocator:
+    """tables: wave table IDs it may hand out.
+    capacity: points the tables may hold together, None for no limit
+    (the controller's WMS? is a limit per table, checked by the caller)."""
+    def __init__(self, tables=range(1, 17), capacity=None) -> None:
+        self.tables = list(tables)
+        self.capacity = capacity
+        # key -> (table, points), least recently used first
+        self.resident = OrderedDict()
+
+    @property
+    def used(self):
+        return sum(points for _, points in self.resident.values())
+
+    def holder(self, table):
+        """key of the trajectory in table, None if it is free"""
+        for key, (t, _) in self.resident.items():
+            if t == table:
+                return key
+        return None
+
+    def lookup(self, key):
+        """table holding the trajectory, None if it is not resident"""
+        if key not in self.resident:
+            return None
+        self.resident.move_to_end(key)
+        return self.resident[key][0]
+
+    def allocate(self, key, points, prefer=None, pinned=()):
+        """(table, [tables given up]) for the trajectory key of points.
+        prefer: table to use if it is free. pinned: tables not to give up."""
+        table = self.lookup(key)
+        if table is not None:
+            return table, []
+        if self.capacity is not None and points > self.capacity:
+            raise MemoryError(f"{points} points do not fit in the capacity of {self.capacity}.")
+        evicted = []
+        while True:
+            used = {t for t, _ in self.resident.values()}
+            free = [t for t in self.tables if t not in used]
+            fits = self.capacity is None or self.used + points <= self.capacity
+            if len(free) > 0 and fits:
+                break
+            victim = next((k for k, (t, _) in self.resident.items() if t not in pinned), None)
+            if victim is None:
+                if len(free) > 0:
+                    raise MemoryError(f"{points} points do not fit next to the {self.used} "
+                                      f"of the pinned tables (capacity {self.capacity}).")
+                raise MemoryError("All wave tables are in use.")
+            evicted.append(self.resident.pop(victim)[0])
+        table = prefer if prefer in free else free[0]
+        self.resident[key] = (table, points)
+        return table, evicted
+
+    def claim(self, table, key, points):
+        """table was loaded with the trajectory key by the caller; whatever it held is gone"""
+        self.release(table)
+        self.resident.pop(key, None)
+        self.resident[key] = (table, points)
+
+    def release(self, table):
+        key = self.holder(table)
+        if key is not None:
+            del self.resident[key]
+
+    def clear(self):
+        self.resident = OrderedDict()
@@ -0,0 +1,64 @@
+# What the controller's wave tables and trigger table were last loaded with.
+# A wave table is known by the hash of the WAV commands that built it; when
+# the same program is about to be sent again and WAV? still reports the length
+# it had, the upload is skipped. TWC/TWS programs are remembered the same way,
+# but the controller can not be asked for them, so they are dropped whenever a
+# wave table turns out to differ (e.g. the controller was restarted).
+import hashlib
+
+def program_key(cmds):
+    """hash of a list of GCS commands"""
+    return hashlib.sha1('\n'.join(cmds).encode()).hexdigest()
+
+def program_length(cmds):
+    """number of points of the table built by the 'WAV id X|& LIN|RAMP seglength ..'
+    or 'WAV id X|& PNT start n ..' commands"""
+    n = 0
+    for cmd in cmds:
+        p = cmd.split(maxsplit=6)
+        seglength = int(p[5]) if p[3].upper() == 'PNT' else int(float(p[4]))
+        n = seglength + (n if p[2] == '&' else 0)
+    return n
+
+class WaveCache:
+    def __init__(self) -> None:
+        self.tables = {}        # table ID -> (program_key, points)
+        self.triggers = None    # program_key of the TWS commands after the last TWC
+        self.hits = 0
+        self.uploads = 0
+
+    def table_loaded(self, table, cmds, wavelen):
+        """True if the table holds cmds. wavelen: decode_WAV of WAV?"""
+        entry = self.tables.get(table)
+        if entry is None:
+            return False
+        if entry[1] != wavelen.get(table, {}).get(1):
+            # not what was uploaded: forget everything about the controller.
+            self.invalidate()
+            return False
+        if entry[0] != program_key(cmds):
+            return False
+        self.hits += 1
+        return True
+
+    def store_table(self, table, cmds):
+        self.tables[table] = (program_key(cmds), program_length(cmds))
+        self.uploads += 1
+
+    def triggers_loaded(self, cmds):
+        if self.triggers is None or self.triggers != program_key(cmds):
+            return False
+        self.hits += 1
+        return True
+
+    def store_triggers(self, cmds):
+        self.triggers = program_key(cmds)
+        self.uploads += 1
+
+    def invalidate(self, *tables):
+        """forget the tables, or everything including the triggers without arguments"""
+        if len(tables)==0:
+            self.tables = {}
+            self.triggers = None
+        for table in tables:
+            self.tables.pop(table, None)
@@ -0,0 +1,92 @@
+# Fitting a sampled path with WAV LIN/RAMP segments.
+# The controller computes LIN and RAMP segments itself from a few numbers, so a
+# piecewise linear path is far shorter to send as segments than as WAV PNT
+# points. fit_segments() cuts the path greedily into the longest straight
+# pieces that stay within tol of every sample, and sends an up and a down
+# piece as one RAMP where the controller's RAMP matches them.
+#
+#   cmds = fit_commands(13, x, tol=1e-4)     # WAV commands for table 13
+import numpy as np
+from .wavemodel import wave_segment
+
+def _line_ok(y, a, b, tol):
+    # the straight line from y[a] to y[b] is within tol of y[a..b]
+    if b - a < 2:
+        return True
+    line = np.linspace(y[a], y[b], b - a + 1)
+    return np.abs(y[a:b+1] - line).max() <= tol
+
+def _lin_end(y, a, tol):
+    """last sample of the longest straight piece starting at a"""
+    n = len(y)
+    # gallop to a length that fails, then bisect
+    good = min(a + 1, n - 1)
+    step = 1
+    while good + step < n and _line_ok(y, a, good + step, tol):
+        good += step
+        step *= 2
+    bad = min(good + step, n)
+    while bad - good > 1:
+        mid = (good + bad)//2
+        if _line_ok(y, a, mid, tol):
+            good = mid
+        else:
+            bad = mid
+    return good
+
+def segment_values(curve, params):
+    """values of one segment (curve, params as in the WAV command after the curve)"""
+    return wave_segment(curve, *params)
+
+def _lin(y, a, b):
+    n = b - a + 1
+    return ('LIN', (n, y[b] - y[a], y[a], n, 0, 0))
+
+def _ramp(y, a, c, b):
+    # up from y[a] to y[c], down towards y[a] until b
+    n = b - a + 1
+    return ('RAMP', (n, y[c] - y[a], y[a], n, 0, 0, c - a))
+
+def fit_segments(y, tol):
+    """[(curve, params), ..] reproducing y within tol, params as in 'WAV id X|& curve params'.
+    LIN: seglength amp offset wavelength startpoint speedupdown
+    RAMP: seglength amp offset wavelength startpoint speedupdown centerpoint"""
+    y = np.asarray(y, dtype=float).ravel()
+    n = len(y)
+    segments = []
+    a = 0
+    c = _lin_end(y, a, tol) if n > 0 else 0
+    while a < n:
+        if c + 1 >= n:
+            segments.append(_lin(y, a, c))
+            break
+        b = _lin_end(y, c + 1, tol)
+        # a RAMP stops one step short of its offset, so the down piece may
+        # have taken the first sample of the next one.
+        for end in (b, b - 1):
+            if end <= c:
+                continue
+            ramp = _ramp(y, a, c, end)
+            if np.abs(segment_values(*ramp) - y[a:end+1]).max() <= tol:
+                segments.append(ramp)
+                a = end + 1
+                if a < n:
+                    c = _lin_end(y, a, tol)
+                break
+        else:
+            segments.append(_lin(y, a, c))
+            a, c = c + 1, b
+    return segments
+
+def segment_commands(table, segments):
+    """WAV commands loading segments into table; the first one clears it"""
+    cmds = []
+    for i, (curve, params) in enumerate(segments):
+        n, amp, offset = params[:3]
+        rest = ' '.join(str(int(p)) for p in params[3:])
+        cmds.append(f"WAV {table} {'&' if i else 'X'} {curve} {int(n)} {amp:.6f} {offset:.6f} {rest}")
+    return cmds
+
+def fit_commands(table, y, tol):
+    """WAV LIN/RAMP commands for table reproducing y within tol (+ 1 nm of rounding)"""
+    return segment_commands(table, fit_segments(y, tol))
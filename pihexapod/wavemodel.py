@@ -0,0 +1,159 @@
+# Local model of the controller's wave tables and trigger output.
+# The LIN/RAMP/PNT segment math of the wave generator and the TWS trigger
+# table, in numpy. Hexapod.wavemodel holds what the package loaded, so the
+# shape, start, velocity and trigger times of a scan can be had without
+# reading the tables back with GWD?. The simulator uses the same math.
+#
+#   m = h.wavemodel
+#   m.start(13), m.values(13), m.velocity(13)
+#   m.trigger_times(1)      # s from the start of the wave
+import numpy as np
+
+SAMPLE_TIME = 0.001     # s per wave table point
+
+def _ramp_corner(t, tc, yc, m1, m2, h):
+    """values of a corner at (tc, yc) from slope m1 to slope m2, rounded by a parabola of half width h"""
+    y = yc + np.where(t < tc, m1, m2)*(t - tc)
+    if h > 0:
+        tau = t - tc
+        blend = np.abs(tau) <= h
+        y = np.where(blend, yc + m1*tau + (m2 - m1)*(tau + h)**2/(4*h), y)
+    return y
+
+def wave_segment(curve, seglength, amp, offset, wavelength, startpoint, speedupdown, centerpoint=0):
+    """values of a 'WAV ... LIN' or 'WAV ... RAMP' segment"""
+    seglength = int(seglength)
+    wavelength = max(int(wavelength), 1)
+    startpoint = int(startpoint)
+    s = float(speedupdown)
+    t = np.arange(wavelength, dtype=float)
+    if curve == 'LIN':
+        if s*2 >= wavelength:
+            s = 0
+        v = amp/(wavelength - 1 - s) if wavelength > 1 else 0.0
+        y = offset + _ramp_corner(t, s/2, 0.0, 0.0, v, s/2)
+        y = np.where(t > (wavelength - 1) - s,
+                     offset + amp - _ramp_corner((wavelength - 1) - t, s/2, 0.0, 0.0, v, s/2), y)
+    elif curve == 'RAMP':
+        c = float(centerpoint)
+        up = amp/c if c > 0 else 0.0
+        down = -amp/(wavelength - c) if wavelength > c else 0.0
+        h = s/2
+        y = offset + np.where(t < c, up*t, amp + down*(t - c))
+        near_start = t <= h
+        near_center = np.abs(t - c) <= h
+        near_end = t >= wavelength - h
+        y = np.where(near_start, offset + _ramp_corner(t, 0.0, 0.0, down, up, h), y)
+        y = np.where(near_center, offset + _ramp_corner(t, c, amp, up, down, h), y)
+        y = np.where(near_end, offset + _ramp_corner(t, float(wavelength), 0.0, down, up, h), y)
+    else:
+        raise ValueError(f"{curve} is not supported.")
+    if startpoint:
+        y = np.roll(y, startpoint)
+    if seglength != wavelength:
+        y = np.resize(y, seglength)
+    return y
+
+def program_values(cmds):
+    """values of the table built by 'WAV id X|& LIN|RAMP|PNT ..' commands"""
+    chunks = []
+    for cmd in cmds:
+        p = cmd.split()
+        append, curve, params = p[2], p[3].upper(), p[4:]
+        if curve == 'PNT':
+            # PNT startpoint n v1 .. vn
+            values = np.array(params[2:], dtype=float)
+        else:
+            values = wave_segment(curve, *[float(v) for v in params])
+        if append != '&':
+            chunks = []
+        chunks.append(values)
+    return np.concatenate(chunks) if chunks else np.zeros(0)
+
+class WaveModel:
+    def __init__(self, sample_time=SAMPLE_TIME) -> None:
+        self.sample_time = sample_time
+        self.programs = {}      # table ID -> WAV commands
+        self.triggers = {}      # output channel -> [(point, switch), ..] as sent by TWS
+        self._values = {}       # table ID -> values, computed when first asked
+
+    def set_table(self, table, cmds, values=None):
+        """table was loaded with the WAV commands cmds. values: the points, if already known"""
+        self.programs[table] = list(cmds)
+        self._values.pop(table, None)
+        if values is not None:
+            self._values[table] = np.array(values, dtype=float)
+
+    def set_triggers(self, cmds, append=False):
+        """the TWS commands cmds were sent, after a TWC unless append"""
+        if not append:
+            self.triggers = {}
+        for cmd in cmds:
+            p = cmd.split()[1:]
+            for ch, point, switch in zip(p[0::3], p[1::3], p[2::3]):
+                self.triggers.setdefault(int(ch), []).append((int(float(point)), int(switch)))
+
+    def forget(self, *tables):
+        """drop the tables, or everything including the triggers without arguments"""
+        if len(tables)==0:
+            self.programs = {}
+            self._values = {}
+            self.triggers = {}
+        for table in tables:
+            self.programs.pop(table, None)
+            self._values.pop(table, None)
+
+    def __contains__(self, table):
+        return table in self.programs
+
+    def values(self, table):
+        """positions of the table, one per SAMPLE_TIME (read-only)"""
+        if table not in self._values:
+            values = program_values(self.programs[table])
+            values.flags.writeable = False
+            self._values[table] = values
+        return self._values[table]
+
+    def start(self, table):
+        return float(self.values(table)[0])
+
+    def time(self, table):
+        return np.arange(len(self.values(table)))*self.sample_time
+
+    def velocity(self, table):
+        """mm/s at each point"""
+        values = self.values(table)
+        if len(values) < 2:
+            return np.zeros(len(values))
+        return np.gradient(values, self.sample_time)
+
+    def trigger_points(self, channel=1):
+        """wave table points where the output goes high (switch 2), in order"""
+        points = [p for p, switch in self.triggers.get(channel, []) if switch == 2]
+        return np.sort(np.array(points, dtype=int))
+
+    def trigger_times(self, channel=1):
+        return self.trigger_points(channel)*self.sample_time
+
+    def trigger_positions(self, table, channel=1):
+        """positions of the table at the trigger points"""
+        values = self.values(table)
+        points = self.trigger_points(channel)
+        return values[points[points < len(values)]]
+
+    def trigger_signal(self, channel=1, npoints=None):
+        """0/1 output of the channel at each point: high from a switch 2 to the next switch 3"""
+        events = sorted(self.triggers.get(channel, []))
+        if npoints is None:
+            npoints = max([p for p, _ in events], default=-1) + 1
+        level = np.zeros(npoints, dtype=np.int8)
+        change = np.zeros(npoints + 1, dtype=np.int8)
+        state = 0
+        for p, switch in events:
+            if p >= npoints:
+                break
+            new = 1 if switch == 2 else 0 if switch == 3 else state
+            change[p] += new - state
+            state = new
+        np.cumsum(change[:npoints], out=level)
+        return level